@@ -0,0 +1,200 @@
+"""brain2neo.batch: convert many Brain XML files in parallel.
+
+Files are converted to Brains by a pool of processes, one brain per
+process at a time, and each brain is written as soon as it is ready by
+a thread holding one connection of a bounded pool per database. Wall
+time approaches that of the largest brain instead of the sum over all
+of them.
+
+Each file is read with its own configuration file, like a single file.
+Use source_namespace to tell brains sharing a database apart.
+
+Counters and timers of the worker processes are merged into the stats
+of the run. Pipelined imports are not supported, brains are written
+once they are parsed.
+
+Every brain written has a journal of its own. A brain whose import
+completes leaves a .done marker beside its file until the whole batch
+succeeds, so that --resume skips it, continues the brains that have a
+journal and starts the others afresh.
+"""
+
+import os
+import glob
+import logging as log
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    as_completed
+
+from .brain2neo import (GraphPool, JournalError, brain_base, done_path,
+                        get_cfg, get_graph, get_journal, get_rejects,
+                        is_pipelined, read_brain, store_entities,
+                        verify_empty)
+from .stats import stats
+
+
+logger = log.getLogger('brain2neo')
+
+
+# extensions of XML files in a directory
+EXTENSIONS = ('.xml', '.xml.gz', '.xml.bz2', '.xml.xz', '.zip')
+
+
+def xml_files(pattern):
+    """ XML files in directory pattern, or files matching glob pattern. """
+    if os.path.isdir(pattern):
+        return sorted(path for ext in EXTENSIONS for path in
+                      glob.glob(os.path.join(pattern, '*' + ext)))
+    return sorted(glob.glob(pattern))
+
+
+def parse_file(xml_file):
+    # runs in a worker process, which reads its own configuration
+    cfg = get_cfg(xml_file)
+    # files are already parsed in parallel, a sharded parser must not
+    # start a pool of its own in every worker
+    cfg['Parse']['parse_jobs'] = 1
+    return read_brain(xml_file, cfg)
+
+
+def parse_worker(xml_file):
+    """ Brain of xml_file and the stats report of its parsing. """
+    # workers are reused, and forked ones start with the parent's stats
+    stats.reset()
+    brain = parse_file(xml_file)
+    return brain, stats.report()
+
+
+def get_pools(cfgs, resume=False):
+    """
+    One GraphPool per database URI of cfgs, with as many connections as
+    the workers option of the first file using it. Databases are checked
+    to be empty once, before any brain is written to them.
+    """
+    pools = {}
+    for cfg in cfgs:
+        uri = cfg['Neo4j']['neo4j_uri']
+        if uri in pools:
+            continue
+
+        graphs = [get_graph(cfg) for _ in range(cfg['Neo4j']['workers'])]
+        if not resume:
+            verify_empty(graphs[0])
+        pools[uri] = GraphPool(graphs)
+
+    return pools
+
+
+def write_brain(xml_file, brain, cfg, pool, resume=False, restart=False):
+    journal = get_journal(xml_file, cfg, batch=True)
+    if resume and os.path.exists(journal.path):
+        journal.resume()
+    else:
+        # brains the interrupted batch had not started yet begin afresh
+        journal.start(restart)
+
+    # a brain is written over a single connection, concurrency comes
+    # from writing several brains at once
+    rejects = get_rejects(xml_file, brain, cfg)
+    with pool.acquire() as graph:
+        store_entities(graph, brain, cfg, journal, GraphPool([graph]),
+                       rejects)
+
+    journal.finish()
+    if rejects is not None:
+        rejects.close()
+
+
+def is_done(xml_file, cfg):
+    """ Whether the import of xml_file completed in an interrupted batch. """
+    if get_journal(xml_file, cfg, batch=True).is_done():
+        logger.info('Skipping {}, its import completed before.'
+                    .format(xml_file))
+        return True
+    return False
+
+
+def remove_done(xml_files):
+    """ Remove the markers of completed imports once the batch is done. """
+    for xml_file in xml_files:
+        path = done_path(xml_file)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def export_brain(xml_file, brain, output_dir):
+    from . import export
+    name = os.path.basename(brain_base(xml_file))
+    export.write_csv(os.path.join(output_dir, name), brain)
+
+
+def convert_files(cfgs, jobs=None, resume=False, output_dir=None,
+                  restart=False):
+    """
+    Convert the XML files that are keys of cfgs, a dictionary of their
+    configurations, with jobs processes (number of CPUs by default).
+    Brains are written to their databases, or as CSV files to
+    subdirectories of output_dir if it is given. Journals of interrupted
+    imports are discarded if restart is set. With resume, brains whose
+    import completed before are skipped and brains without a journal are
+    started afresh. Returns a dictionary of errors with keys the files
+    that failed.
+    """
+    pools = {}
+    if output_dir is None:
+        pools = get_pools(cfgs.values(), resume)
+    n_writers = sum(pool.size for pool in pools.values()) or 1
+
+    errors = {}
+    pending = []
+    for xml_file, cfg in cfgs.items():
+        if output_dir is None and is_pipelined(cfg):
+            logger.warning('Ignoring pipelined for {}, brains of a batch '
+                           'are written once parsed.'.format(xml_file))
+        try:
+            if output_dir is None and resume and is_done(xml_file, cfg):
+                continue
+        except JournalError as e:
+            errors[xml_file] = e
+            continue
+        pending.append(xml_file)
+
+    with ProcessPoolExecutor(jobs) as parsers, \
+            ThreadPoolExecutor(n_writers) as writers:
+        parsed = {parsers.submit(parse_worker, xml_file): xml_file
+                  for xml_file in pending}
+        written = {}
+        for future in as_completed(parsed):
+            xml_file = parsed[future]
+            try:
+                brain, report = future.result()
+            except Exception as e:
+                errors[xml_file] = e
+                continue
+            stats.merge(report)
+
+            logger.info('Parsed {}, {} nodes and {} relationships.'
+                        .format(xml_file, brain.node_count(),
+                                brain.relationship_count()))
+            cfg = cfgs[xml_file]
+            if output_dir is not None:
+                task = writers.submit(export_brain, xml_file, brain,
+                                      output_dir)
+            else:
+                pool = pools[cfg['Neo4j']['neo4j_uri']]
+                task = writers.submit(write_brain, xml_file, brain, cfg,
+                                      pool, resume, restart)
+            written[task] = xml_file
+
+        for future in as_completed(written):
+            try:
+                future.result()
+            except Exception as e:
+                errors[written[future]] = e
+
+    for xml_file, e in sorted(errors.items()):
+        logger.error('Converting {} failed: {}'.format(xml_file, e))
+    if output_dir is None and not errors:
+        remove_done(cfgs)
+
+    return errors
@@ -0,0 +1,168 @@
+"""brain2neo.benchmark: time and memory of every conversion phase.
+
+A synthetic brain (see brain2neo.generate) is converted phase by phase
+and written to the in-memory graph of the tests (test/memory_graph.py),
+so no server is needed. It runs from a source checkout.
+
+    $ python -m brain2neo.benchmark --thoughts 100000 --links 200000 \
+        --memory --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+from . import brain2neo as b2n
+from .generate import write_brain
+from .shard import sharded_brain
+
+
+class Phases(object):
+    """ Collects time and (optionally) peak traced memory of phases. """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.results = []
+
+    def run(self, name, function, *args):
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        peak = None
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        self.results.append({'phase': name, 'seconds': elapsed,
+                             'peak_bytes': peak})
+        return result
+
+
+def startup_seconds(runs=5):
+    """
+    Best time of importing brain2neo in a new interpreter, less the time
+    of starting the interpreter alone.
+    """
+    def best(code):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, '-c', code])
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    return best('import brain2neo.brain2neo') - best('pass')
+
+
+def run_phases(xml_file, cfg, phases, graph):
+    """ Convert xml_file and write it to graph phase by phase. """
+    root = phases.run('get_root', b2n.get_root, xml_file)
+    brain, types = phases.run('parse_thoughts', b2n.parse_thoughts, root,
+                              cfg)
+    phases.run('parse_attachments', b2n.parse_attachments, root, brain, cfg)
+    phases.run('parse_links', b2n.parse_links, root, brain, types, cfg)
+    del root
+
+    brain = phases.run('stream_brain', b2n.stream_brain, xml_file, cfg)
+    phases.run('expat_brain', b2n.expat_brain, xml_file, cfg)
+    phases.run('sharded_brain', sharded_brain, xml_file, cfg)
+
+    sizer = b2n.BatchSizer(cfg)
+    node_ids = [None] * brain.node_count()
+    phases.run('create_nodes', b2n.create_nodes, graph, brain,
+               range(brain.node_count()), node_ids, sizer)
+    phases.run('create_relationships', b2n.create_relationships, graph,
+               brain, range(brain.relationship_count()), node_ids, sizer)
+
+    return brain
+
+
+def benchmark(work_dir, graph, memory=False, **options):
+    """
+    Generate a brain with options (see generate_brain) in work_dir and
+    benchmark its conversion to graph. Returns a report dictionary.
+    """
+    xml_file = os.path.join(work_dir, 'brain.xml')
+    write_brain(xml_file, **options)
+    cfg = b2n.get_cfg(xml_file)
+
+    phases = Phases(memory)
+    brain = run_phases(xml_file, cfg, phases, graph)
+
+    return {'options': options,
+            'xml_bytes': os.path.getsize(xml_file),
+            'nodes': brain.node_count(),
+            'relationships': brain.relationship_count(),
+            'statements': graph.n_statements,
+            'startup_seconds': startup_seconds(),
+            'phases': phases.results}
+
+
+def print_report(report):
+    print('{} bytes of XML, {} nodes, {} relationships, {} statements'
+          .format(report['xml_bytes'], report['nodes'],
+                  report['relationships'], report['statements']))
+    print('{:<22}{:>10.3f}s'.format('startup', report['startup_seconds']))
+    for result in report['phases']:
+        peak = result['peak_bytes']
+        print('{:<22}{:>10.3f}s{}'.format(
+            result['phase'], result['seconds'],
+            '' if peak is None else '{:>12.1f} MB'.format(peak / 2 ** 20)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark conversion phases on a synthetic brain')
+    parser.add_argument('--thoughts', type=int, default=10000)
+    parser.add_argument('--types', type=int, default=20)
+    parser.add_argument('--links', type=int, default=20000)
+    parser.add_argument('--link-types', type=int, default=10)
+    parser.add_argument('--attachments', type=int, default=2000)
+    parser.add_argument('--forgotten', type=float, default=0.01)
+    parser.add_argument('--private', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true',
+                        help='trace peak memory of each phase '
+                             '(slows phases down)')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write report to FILE')
+
+    args = parser.parse_args()
+
+    test_dir = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'test')
+    sys.path.insert(0, test_dir)
+    try:
+        from memory_graph import MemoryGraph
+    except ImportError:
+        sys.exit('The benchmark needs {} of a source checkout.'
+                 .format(os.path.join(test_dir, 'memory_graph.py')))
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        report = benchmark(work_dir, MemoryGraph(keep=False), args.memory,
+                           thoughts=args.thoughts,
+                           types=args.types, links=args.links,
+                           link_types=args.link_types,
+                           attachments=args.attachments,
+                           forgotten=args.forgotten, private=args.private,
+                           seed=args.seed)
+    finally:
+        shutil.rmtree(work_dir)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
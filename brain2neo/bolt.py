@@ -0,0 +1,126 @@
+"""brain2neo.bolt: write through the Bolt protocol with neo4j-driver.
+
+BoltGraph offers the part of the py2neo Graph interface used by brain2neo,
+run(statement, **parameters) returning a cursor with data and evaluate,
+so the batched writers work unchanged. Every statement runs in an
+explicit transaction of a session that is kept open between statements.
+Graphs of the same URI share one driver and therefore its connection
+pool, so the connections of concurrent workers are reused as well.
+"""
+
+import threading
+
+from urllib.parse import urlsplit, urlunsplit
+
+from neo4j import GraphDatabase
+from neo4j.exceptions import CypherError, ServiceUnavailable, \
+    SessionExpired
+from py2neo import GraphError
+
+
+# drivers with keys (uri, user)
+drivers = {}
+drivers_lock = threading.Lock()
+
+
+def split_auth(uri):
+    """ Split credentials of the form user:pass@ out of uri. """
+    parts = urlsplit(uri)
+    if parts.username is None:
+        return uri, None
+
+    netloc = parts.hostname
+    if parts.port is not None:
+        netloc = '{}:{}'.format(netloc, parts.port)
+    uri = urlunsplit((parts.scheme, netloc, parts.path, parts.query,
+                      parts.fragment))
+    return uri, (parts.username, parts.password or '')
+
+
+def get_driver(neo4j_uri, cfg):
+    uri, auth = split_auth(neo4j_uri)
+    key = (uri, auth and auth[0])
+    with drivers_lock:
+        driver = drivers.get(key)
+        if driver is None:
+            neo4j_cfg = cfg['Neo4j']
+            driver = GraphDatabase.driver(
+                uri, auth=auth,
+                connection_timeout=neo4j_cfg['connection_timeout'],
+                connection_acquisition_timeout=neo4j_cfg['fetch_timeout'],
+                max_connection_pool_size=max(100, neo4j_cfg['workers']))
+            drivers[key] = driver
+        return driver
+
+
+def close_drivers():
+    with drivers_lock:
+        for driver in drivers.values():
+            driver.close()
+        drivers.clear()
+
+
+class BoltCursor(object):
+    def __init__(self, records):
+        self.records = records
+
+    def data(self):
+        return self.records
+
+    def evaluate(self):
+        if not self.records:
+            return None
+        return next(iter(self.records[0].values()))
+
+
+def graph_error(e):
+    """ GraphError with the Neo4j status code and classification of e. """
+    error = GraphError(str(e))
+    error.code = getattr(e, 'code', None)
+    # lost connections are retried like transient server errors
+    error.classification = error.code.split('.')[1] if error.code \
+        else 'TransientError'
+    return error
+
+
+class BoltGraph(object):
+    """
+    Runs statements in explicit transactions of a reused session. Driver
+    errors are raised as GraphError, like the errors of py2neo, with the
+    code and classification of the server error.
+    """
+
+    def __init__(self, neo4j_uri, cfg):
+        self.driver = get_driver(neo4j_uri, cfg)
+        # None leaves the transaction timeout to the server
+        self.tx_timeout = cfg['Neo4j']['transaction_timeout'] or None
+        self.session = None
+
+    def run(self, statement, parameters=None, **kwparameters):
+        parameters = dict(parameters or {}, **kwparameters)
+        if self.session is None:
+            self.session = self.driver.session()
+
+        try:
+            tx = self.session.begin_transaction(timeout=self.tx_timeout)
+            try:
+                records = [dict(record.items())
+                           for record in tx.run(statement, parameters)]
+            except BaseException:
+                tx.rollback()
+                raise
+            tx.commit()
+        except (CypherError, ServiceUnavailable, SessionExpired) as e:
+            # start over with a fresh session and connection
+            self.close()
+            raise graph_error(e) from e
+
+        return BoltCursor(records)
+
+    def close(self):
+        if self.session is not None:
+            session, self.session = self.session, None
+            try:
+                session.close()
+            except (ServiceUnavailable, SessionExpired):
+                pass
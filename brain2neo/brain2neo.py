@@ -1,46 +1,1144 @@
 #!/usr/bin/env python
 
 import os
+import sys
+import mmap
 import html
-import functools
-import operator as op
+import json
+import time
+import queue
+import random
+import hashlib
+import threading
 import logging as log
 
-from pkg_resources import resource_filename
+from array import array
+from collections import namedtuple
+from contextlib import contextmanager
 
-from xml.etree.ElementTree import ParseError, parse
+from xml.etree.ElementTree import ParseError, parse, iterparse
 
-from py2neo import Graph, Node, Relationship, GraphError
-from configobj import ConfigObj, flatten_errors
-from validate import Validator
+from .stats import stats, timed
+
+# py2neo, neo4j-driver, configobj and concurrent.futures are imported
+# where they are used, so that the command line starts quickly and modes
+# that do not write to a database never load a driver
 
 
 logger = log.getLogger('brain2neo')
 
+SPEC_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'spec', 'specification.cfg')
+
+
+# Compact records holding only the fields of XML elements that are used
+# during conversion. Missing or empty tags are stored as None.
+ThoughtRecord = namedtuple('ThoughtRecord', [
+    'guid', 'name', 'is_type', 'forgotten', 'access_control_type',
+    'modified', 'created', 'activated'])
+
+LinkRecord = namedtuple('LinkRecord', [
+    'guid', 'ida', 'idb', 'dir', 'is_backward', 'strength', 'name',
+    'is_type', 'link_type_id', 'modified', 'created'])
+
+# temporal properties of nodes and relationships, in the order of the
+# tuples of Brain.node_times and Brain.rel_times
+NODE_TIMESTAMPS = ('created_at', 'modified_at', 'activated_at')
+REL_TIMESTAMPS = ('created_at', 'modified_at')
+
+AttachmentRecord = namedtuple('AttachmentRecord', [
+    'object_id', 'attachment_type', 'location'])
+
+
+class Brain(object):
+    """
+    Compact representation of a converted brain.
+
+    Nodes and relationships are stored column-wise in parallel lists and
+    arrays, relationships refer to their endpoints by node index. Label
+    sets and relationship types are interned, so nodes of the same types
+    share one label set object. Properties other than name are kept only
+    for nodes that have them.
+    """
+
+    __slots__ = ('store_guid', 'node_index', 'node_guids', 'node_names',
+                 'node_labels', 'node_modified', 'node_extra', 'rel_guids',
+                 'rel_starts', 'rel_ends', 'rel_types', 'rel_modified',
+                 'label_sets', 'source', 'source_label', 'timestamps',
+                 'node_times', 'rel_times')
+
+    def __init__(self, store_guid=False, timestamps=False, node_index=None):
+        # store guid and modified properties of nodes and relationships
+        self.store_guid = store_guid
+        # store timestamps of nodes and relationships, as they are in the
+        # XML, converted to ISO 8601 when properties are built
+        self.timestamps = timestamps
+        # node indices with keys guid values, a dict or a GuidIndex
+        self.node_index = {} if node_index is None else node_index
+        self.node_guids = []
+        self.node_names = []
+        self.node_labels = []
+        self.node_modified = []
+        # additional node properties (URL, path) with keys node indices
+        self.node_extra = {}
+        self.rel_guids = []
+        self.rel_starts = array('l')
+        self.rel_ends = array('l')
+        self.rel_types = []
+        self.rel_modified = []
+        # tuples of timestamps, empty unless timestamps is set
+        self.node_times = []
+        self.rel_times = []
+        # interned label sets, each with keys itself
+        empty = frozenset()
+        self.label_sets = {empty: empty}
+        # Source guid stored with every node, if set
+        self.source = None
+        # Source label of every node, if set
+        self.source_label = None
+
+    def node_count(self):
+        return len(self.node_guids)
+
+    def relationship_count(self):
+        return len(self.rel_guids)
+
+    def add_node(self, guid, name, modified=None, times=None):
+        i = len(self.node_guids)
+        self.node_index[guid] = i
+        self.node_guids.append(guid)
+        self.node_names.append(name)
+        self.node_labels.append(self.label_sets[frozenset()])
+        self.node_modified.append(modified if self.store_guid else None)
+        if self.timestamps:
+            self.node_times.append(times)
+        return i
+
+    def add_label(self, i, label):
+        labels = self.node_labels[i] | {label}
+        self.node_labels[i] = self.label_sets.setdefault(labels, labels)
+
+    def set_property(self, i, key, value):
+        self.node_extra.setdefault(i, {})[key] = value
+
+    def add_relationship(self, guid, start, rel_type, end, modified=None,
+                         times=None):
+        self.rel_guids.append(guid)
+        self.rel_starts.append(start)
+        self.rel_ends.append(end)
+        self.rel_types.append(sys.intern(rel_type))
+        self.rel_modified.append(modified if self.store_guid else None)
+        if self.timestamps:
+            self.rel_times.append(times)
+
+    def node_properties(self, i):
+        props = {'name': self.node_names[i]}
+        if self.store_guid:
+            props['guid'] = self.node_guids[i]
+            props['modified'] = self.node_modified[i]
+        if self.source is not None:
+            props['source'] = self.source
+        if self.timestamps:
+            props.update(zip(NODE_TIMESTAMPS,
+                             map(brain_datetime, self.node_times[i])))
+        props.update(self.node_extra.get(i, ()))
+        return props
+
+    def relationship_properties(self, j):
+        props = {}
+        if self.store_guid:
+            props['guid'] = self.rel_guids[j]
+            props['modified'] = self.rel_modified[j]
+        if self.timestamps:
+            props.update(zip(REL_TIMESTAMPS,
+                             map(brain_datetime, self.rel_times[j])))
+        return props
+
+
+def cypher_name(name):
+    """ Quote a label or relationship type for use in a Cypher statement. """
+    return '`{}`'.format(name.replace('`', '``'))
+
+
+def datetime_clause(name, keys):
+    """ Cypher clause converting ISO 8601 properties keys of name. """
+    if not keys:
+        return ''
+    return ' SET ' + ', '.join('{0}.{1} = datetime({0}.{1})'.format(name, key)
+                               for key in keys)
+
+
+def create_nodes_statement(labels, timestamps=False):
+    return ('UNWIND $rows AS row '
+            'CREATE (n{}) SET n = row.props{} '
+            'RETURN row.i AS i, id(n) AS id'
+            .format(''.join(':' + cypher_name(label)
+                            for label in sorted(labels)),
+                    datetime_clause('n', timestamps and NODE_TIMESTAMPS)))
+
+
+def create_relationships_statement(rel_type, timestamps=False):
+    return ('UNWIND $rows AS row '
+            'MATCH (a) WHERE id(a) = row.a '
+            'MATCH (b) WHERE id(b) = row.b '
+            'CREATE (a)-[r:{}]->(b) SET r = row.props{}'
+            .format(cypher_name(rel_type),
+                    datetime_clause('r', timestamps and REL_TIMESTAMPS)))
+
+
+class BatchSizer(object):
+    """
+    Decides how many rows go in each transaction and how failed
+    transactions are retried.
+
+    Batches hold batch_size rows, cut short when their approximate size
+    exceeds batch_bytes (if set). In adaptive mode batch size starts from
+    batch_size and is scaled towards target_latency after every commit
+    and halved after a server error, always within min_batch_size and
+    max_batch_size. Rows that fail alone go to rejects, if given.
+    """
+
+    def __init__(self, cfg, rejects=None):
+        neo4j_cfg = cfg['Neo4j']
+        self.adaptive = neo4j_cfg['adaptive_batch']
+        self.max_bytes = neo4j_cfg['batch_bytes']
+        self.target_latency = neo4j_cfg['target_latency']
+        if self.adaptive:
+            self.min_size = neo4j_cfg['min_batch_size']
+            self.max_size = max(self.min_size, neo4j_cfg['max_batch_size'])
+        else:
+            self.min_size = self.max_size = neo4j_cfg['batch_size']
+        self.size = self.clamp(neo4j_cfg['batch_size'])
+        # shared by all writers of the database, None if unlimited
+        self.throttle = get_throttle(cfg)
+        self.max_retries = neo4j_cfg['max_retries']
+        self.retry_delay = neo4j_cfg['retry_delay']
+        self.max_backoff = neo4j_cfg['max_backoff']
+        self.rejects = rejects
+
+    def clamp(self, size):
+        return max(self.min_size, min(self.max_size, int(size)))
+
+    def next_batch(self, rows, start):
+        batch = rows[start:start + self.size]
+        if not self.max_bytes:
+            return batch
+
+        n_bytes = 0
+        for n, row in enumerate(batch):
+            # repr is a cheap approximation of the serialized row
+            n_bytes += len(repr(row))
+            if n_bytes > self.max_bytes and n > 0:
+                return batch[:n]
+
+        return batch
+
+    def committed(self, n_rows, latency):
+        if not self.adaptive or n_rows < self.size:
+            return
+
+        # scale towards target latency, at most doubling or halving
+        ratio = self.target_latency / latency if latency > 0 else 2.0
+        size = self.clamp(self.size * max(0.5, min(2.0, ratio)))
+        if size != self.size:
+            logger.debug('Batch size: {} -> {}'.format(self.size, size))
+            self.size = size
+
+    def failed(self):
+        """ Shrink batch size after a server error, False if at minimum. """
+        if not self.adaptive or self.size <= self.min_size:
+            return False
+
+        self.size = self.clamp(self.size // 2)
+        logger.warning('Server error, retrying with batch size {}.'
+                       .format(self.size))
+        return True
+
+
+class Throttle(object):
+    """
+    Paces the transactions written to a database.
+
+    Transactions start at most max_tx_rate times per second and carry at
+    most max_row_rate rows per second, with at most max_in_flight of them
+    running at once. On top of that a delay between transactions doubles
+    whenever a commit takes longer than max_latency or the server returns
+    an error, up to max_backoff, and halves after every commit within
+    max_latency.
+    """
+
+    # smallest delay after a backoff and below which it is dropped
+    MIN_DELAY = 0.05
+
+    def __init__(self, cfg):
+        neo4j_cfg = cfg['Neo4j']
+        tx_rate = neo4j_cfg['max_tx_rate']
+        row_rate = neo4j_cfg['max_row_rate']
+        self.tx_interval = 1.0 / tx_rate if tx_rate else 0.0
+        self.row_interval = 1.0 / row_rate if row_rate else 0.0
+        self.max_latency = neo4j_cfg['max_latency']
+        self.max_backoff = neo4j_cfg['max_backoff']
+        max_in_flight = neo4j_cfg['max_in_flight']
+        self.in_flight = threading.BoundedSemaphore(max_in_flight) \
+            if max_in_flight else None
+        self.lock = threading.Lock()
+        # earliest start of the next transaction (time.monotonic)
+        self.next_start = 0.0
+        self.delay = 0.0
+
+    def wait(self, n_rows):
+        """ Sleep until a transaction of n_rows rows may start. """
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.delay + \
+                max(self.tx_interval, n_rows * self.row_interval)
+
+        if start > now:
+            stats.count('throttled_ms', int(1000 * (start - now)))
+            time.sleep(start - now)
+
+    @contextmanager
+    def transaction(self, n_rows):
+        self.wait(n_rows)
+        if self.in_flight is not None:
+            self.in_flight.acquire()
+        try:
+            start = time.time()
+            try:
+                yield
+            except BaseException:
+                self.back_off('server error')
+                raise
+            latency = time.time() - start
+            if self.max_latency and latency > self.max_latency:
+                self.back_off('commit latency {:.2f}s'.format(latency))
+            elif self.delay:
+                with self.lock:
+                    self.delay /= 2
+                    if self.delay < self.MIN_DELAY:
+                        self.delay = 0.0
+        finally:
+            if self.in_flight is not None:
+                self.in_flight.release()
+
+    def back_off(self, reason):
+        with self.lock:
+            self.delay = min(self.max_backoff,
+                             max(self.MIN_DELAY, 2 * self.delay))
+            delay = self.delay
+        stats.count('backoffs')
+        logger.debug('Backing off after {}, delay {:.2f}s.'
+                     .format(reason, delay))
+
+
+# throttles with keys database URIs and their limits
+throttles = {}
+throttles_lock = threading.Lock()
+
+THROTTLE_OPTIONS = ('max_tx_rate', 'max_row_rate', 'max_in_flight',
+                    'max_latency', 'max_backoff')
+
+
+def get_throttle(cfg):
+    """ Throttle of the database of cfg, None if writes are unlimited. """
+    neo4j_cfg = cfg['Neo4j']
+    limits = tuple(neo4j_cfg[option] for option in THROTTLE_OPTIONS)
+    if not any(limits[:-1]):
+        return None
+
+    key = (neo4j_cfg['neo4j_uri'],) + limits
+    with throttles_lock:
+        if key not in throttles:
+            throttles[key] = Throttle(cfg)
+        return throttles[key]
+
+
+@contextmanager
+def throttled(throttle, n_rows):
+    if throttle is None:
+        yield
+    else:
+        with throttle.transaction(n_rows):
+            yield
+
+
+def is_transient(error):
+    """
+    Whether a server error may go away when the transaction is retried,
+    like deadlocks, lock timeouts or lost connections.
+    """
+    names = (type(error).__name__,
+             getattr(error, 'classification', None) or '',
+             getattr(error, 'code', None) or '')
+    return any('TransientError' in name for name in names)
+
+
+# codes of errors that fail every batch alike, whatever its rows
+ROW_INDEPENDENT_ERRORS = ('.Security.', '.Statement.SyntaxError',
+                          '.Statement.UnknownFunction', 'Neo.DatabaseError.')
+
+
+def is_row_independent(error):
+    """
+    Whether a server error does not depend on the rows of the batch, like
+    syntax errors, unknown functions (datetime() before Neo4j 3.4),
+    authorization errors or database errors. Such batches are neither
+    retried smaller nor bisected.
+    """
+    code = getattr(error, 'code', None) or ''
+    return getattr(error, 'classification', None) == 'DatabaseError' or \
+        any(part in code for part in ROW_INDEPENDENT_ERRORS)
+
+
+def run_batch(graph, statement, rows, sizer):
+    """
+    Records of statement run with rows in one transaction, retried up to
+    max_retries times after transient errors with exponential backoff.
+    """
+    from py2neo import GraphError
+
+    delay = sizer.retry_delay
+    for attempt in range(sizer.max_retries + 1):
+        try:
+            with throttled(sizer.throttle, len(rows)):
+                start = time.time()
+                records = graph.run(statement, rows=rows).data()
+        except GraphError as e:
+            if not is_transient(e) or attempt == sizer.max_retries:
+                raise
+            stats.count('retries')
+            logger.warning('Transient error, retrying in {:.2f}s: {}'
+                           .format(delay, e))
+            # jitter keeps deadlocked workers from retrying in lockstep
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(sizer.max_backoff, 2 * delay)
+        else:
+            sizer.committed(len(rows), time.time() - start)
+            return records
+
+
+def batch_committed(rows, records, on_commit):
+    stats.count('batches')
+    stats.count('rows_written', len(rows))
+    if on_commit is not None:
+        on_commit(rows, records)
 
-def chunks(l, n):
-    """ Yield successive n-sized chunks from l. """
-    for i in range(0, len(l), n):
-        yield l[i:i+n]
 
+def bisect_batch(graph, statement, rows, sizer, on_commit, error):
+    """
+    Records of the rows of a batch that failed with error that commit
+    without the others, and the number of rows rejected. The batch is
+    split in halves until the rows that fail alone are found, which are
+    rejected.
+    """
+    from py2neo import GraphError
+
+    if len(rows) == 1:
+        sizer.rejects.reject(rows[0], error)
+        return [], 1
 
-def create_entities(graph, entities):
-    entities_v = list(entities.values())
+    records = []
+    n_rejected = 0
+    half = len(rows) // 2
+    for part in (rows[:half], rows[half:]):
+        try:
+            part_records = run_batch(graph, statement, part, sizer)
+        except GraphError as e:
+            if is_transient(e) or is_row_independent(e):
+                raise
+            part_records, n = bisect_batch(graph, statement, part, sizer,
+                                           on_commit, e)
+            n_rejected += n
+        else:
+            batch_committed(part, part_records, on_commit)
+        records.extend(part_records)
 
-    s = 1
-    batch_size = 100
-    logger.debug('Batch size: {}'.format(batch_size))
-    for entities_batch in chunks(entities_v, batch_size):
-        logger.debug('Batch: {}-{}'.format(s, s + len(entities_batch) - 1))
-        s += batch_size
-        graph.create(functools.reduce(op.or_, entities_batch))
+    return records, n_rejected
 
 
-def update_type(id1, id2, types, nodes):
-    if id1 in types and id2 in nodes:
-        nodes[id2].add_label(types[id1])
-    elif id2 in types and id1 in nodes:
-        nodes[id1].add_label(types[id2])
+@timed
+def create_entities(graph, statement, rows, sizer, on_commit=None,
+                    on_begin=None):
+    """
+    Run a parameterized statement once per batch of rows, each batch passed
+    as the $rows parameter and committed as its own transaction. Returns
+    the records of all batches.
+
+    on_commit, if given, is called with the rows and records of every
+    committed batch, on_begin with the rows of every batch before it is
+    run.
+
+    Transient errors are retried by run_batch. A batch failing otherwise
+    is retried smaller in adaptive mode and then, if sizer has rejects,
+    bisected so that only the rows failing alone are left out. Errors
+    that do not depend on the rows are raised right away, and so is the
+    error of a batch whose rows all fail alone, since the statement
+    rather than the data is then at fault.
+    """
+    from py2neo import GraphError
+
+    records = []
+
+    s = 0
+    logger.debug('Batch size: {}'.format(sizer.size))
+    while s < len(rows):
+        rows_batch = sizer.next_batch(rows, s)
+        logger.debug('Batch: {}-{}'.format(s + 1, s + len(rows_batch)))
+        if on_begin is not None:
+            on_begin(rows_batch)
+        try:
+            batch_records = run_batch(graph, statement, rows_batch, sizer)
+        except GraphError as e:
+            if is_row_independent(e):
+                raise
+            # failed batch was rolled back, retry it smaller if possible
+            if sizer.failed():
+                stats.count('retries')
+                continue
+            if is_transient(e) or sizer.rejects is None:
+                raise
+            logger.warning('Batch failed, looking for failing rows: {}'
+                           .format(e))
+            batch_records, n_rejected = bisect_batch(
+                graph, statement, rows_batch, sizer, on_commit, e)
+            if len(rows_batch) > 1 and n_rejected == len(rows_batch):
+                logger.error('Every row of the batch failed alone, '
+                             'giving up.')
+                raise
+        else:
+            batch_committed(rows_batch, batch_records, on_commit)
+
+        records.extend(batch_records)
+        s += len(rows_batch)
+
+    return records
+
+
+def node_rows(brain, indices):
+    """
+    Group nodes of brain with given indices by label set. Returns a
+    dictionary of row lists with keys label sets, each row holding the
+    node index.
+    """
+    groups = {}
+    for i in indices:
+        groups.setdefault(brain.node_labels[i], []).append(
+            {'i': i, 'props': brain.node_properties(i)})
+
+    return groups
+
+
+def relationship_rows(brain, indices, node_ids, rejects=None):
+    """
+    Group relationships of brain with given indices by type. Returns a
+    dictionary of row lists with keys relationship types, each row holding
+    the relationship index and the database ids of the connected nodes.
+    Relationships of nodes in rejects are rejected as well.
+    """
+    groups = {}
+    for j in indices:
+        if rejects is not None and rejects.nodes and \
+                (brain.rel_starts[j] in rejects.nodes
+                 or brain.rel_ends[j] in rejects.nodes):
+            rejects.reject({'j': j}, 'node of relationship was rejected')
+            continue
+        groups.setdefault(brain.rel_types[j], []).append(
+            {'j': j,
+             'a': node_ids[brain.rel_starts[j]],
+             'b': node_ids[brain.rel_ends[j]],
+             'props': brain.relationship_properties(j)})
+
+    return groups
+
+
+def log_rate(what, n_rows, start):
+    elapsed = time.time() - start
+    rate = n_rows / elapsed if elapsed > 0 else float('inf')
+    logger.info('Created {} {} in {:.2f}s ({:.0f} rows/sec).'
+                .format(n_rows, what, elapsed, rate))
+
+
+@timed
+def create_nodes(graph, brain, indices, node_ids, sizer, journal=None):
+    """
+    Create nodes of brain with given indices, with one UNWIND statement
+    per label set. Their database ids are stored in node_ids.
+    """
+    start = time.time()
+    on_commit = on_begin = None
+    if journal is not None:
+        on_commit, on_begin = journal.nodes_committed, journal.nodes_begun
+    create_labeled(graph, node_rows(brain, indices), node_ids, sizer,
+                   on_commit, brain.timestamps, on_begin)
+
+    log_rate('nodes', len(indices), start)
+
+
+def create_labeled(graph, groups, node_ids, sizer, on_commit=None,
+                   timestamps=False, on_begin=None):
+    """ Create the node rows of groups, keyed by label set. """
+    for labels, rows in groups.items():
+        statement = create_nodes_statement(labels, timestamps)
+        for record in create_entities(graph, statement, rows, sizer,
+                                      on_commit, on_begin):
+            node_ids[record['i']] = record['id']
+
+
+@timed
+def create_relationships(graph, brain, indices, node_ids, sizer, pool=None,
+                         journal=None):
+    """
+    Create relationships of brain with given indices, with one UNWIND
+    statement per type, matching endpoints by their database ids in
+    node_ids.
+
+    If a GraphPool with more than one connection is given, batches are
+    written concurrently by partition_relationships.
+    """
+    start = time.time()
+    groups = relationship_rows(brain, indices, node_ids, sizer.rejects)
+    on_commit = on_begin = None
+    if journal is not None:
+        on_commit = journal.relationships_committed
+        on_begin = journal.relationships_begun
+    if pool is not None and pool.size > 1:
+        create_partitioned(pool, groups, sizer, on_commit, brain.timestamps,
+                           on_begin)
+    else:
+        create_typed(graph, groups, sizer, on_commit, brain.timestamps,
+                     on_begin)
+
+    log_rate('relationships', len(indices), start)
+
+
+def schema_statements(brain, cfg):
+    """
+    Uniqueness constraint on guid followed by the indexes on name of
+    thought_label and of every other label of brain.
+    """
+    thought_label = cfg['Neo4j']['thought_label']
+    labels = set().union(*brain.label_sets) - {thought_label}
+
+    statements = ['CREATE CONSTRAINT ON (n:{}) ASSERT n.guid IS UNIQUE'
+                  .format(cypher_name(thought_label))]
+    for label in [thought_label] + sorted(labels):
+        statements.append('CREATE INDEX ON :{}(name)'
+                          .format(cypher_name(label)))
+
+    return statements
+
+
+@timed
+def create_schema(graph, brain, cfg):
+    """ Create constraint and indexes of schema mode, if enabled. """
+    if not is_schema(cfg):
+        return
+
+    logger.info('Creating constraint and indexes.')
+    for statement in schema_statements(brain, cfg):
+        graph.run(statement)
+
+
+def create_typed(graph, groups, sizer, on_commit=None, timestamps=False,
+                 on_begin=None):
+    """ Create the relationship rows of groups, keyed by type. """
+    for rel_type, rows in groups.items():
+        create_entities(graph,
+                        create_relationships_statement(rel_type, timestamps),
+                        rows, sizer, on_commit, on_begin)
+
+
+class GraphPool(object):
+    """ A fixed set of graph connections shared by worker threads. """
+
+    def __init__(self, graphs):
+        self.size = len(graphs)
+        self.graphs = queue.Queue()
+        for graph in graphs:
+            self.graphs.put(graph)
+
+    @contextmanager
+    def acquire(self):
+        graph = self.graphs.get()
+        try:
+            yield graph
+        finally:
+            self.graphs.put(graph)
+
+
+def round_robin(n):
+    """
+    Pair n (even) buckets in n - 1 rounds so that every pair of distinct
+    buckets appears once and no bucket appears twice in a round.
+    """
+    buckets = list(range(n))
+    rounds = []
+    for _ in range(n - 1):
+        rounds.append([tuple(sorted((buckets[i], buckets[n - 1 - i])))
+                       for i in range(n // 2)])
+        # keep first bucket fixed and rotate the rest
+        buckets = buckets[:1] + buckets[-1:] + buckets[1:-1]
+
+    return rounds
+
+
+def partition_relationships(groups, n_buckets):
+    """
+    Split relationship rows into cells keyed by the pair of buckets of
+    their endpoints and schedule the cells in rounds. Cells of the same
+    round touch disjoint sets of nodes, so their transactions never wait
+    on each others locks. Returns a list of rounds, each a list of cells
+    with rows grouped by type.
+    """
+    cells = {}
+    for rel_type, rows in groups.items():
+        for row in rows:
+            pair = tuple(sorted((row['a'] % n_buckets, row['b'] % n_buckets)))
+            cells.setdefault(pair, {}).setdefault(rel_type, []).append(row)
+
+    pairs = [[(i, i) for i in range(n_buckets)]] + round_robin(n_buckets)
+
+    return [[cells[pair] for pair in pairs_round if pair in cells]
+            for pairs_round in pairs]
+
+
+def create_partitioned(pool, groups, sizer, on_commit=None,
+                       timestamps=False, on_begin=None):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def create_cell(cell):
+        with pool.acquire() as graph:
+            create_typed(graph, cell, sizer, on_commit, timestamps,
+                         on_begin)
+
+    # twice as many buckets as workers, so each round of distinct pairs
+    # has one cell per worker
+    rounds = partition_relationships(groups, 2 * pool.size)
+
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        for n, cells in enumerate(rounds):
+            logger.debug('Round {}: {} cells.'.format(n + 1, len(cells)))
+            # wait for every cell of the round, raising its errors
+            for _ in executor.map(create_cell, cells):
+                pass
+
+
+class JournalError(Exception):
+    pass
+
+
+class Journal(object):
+    """
+    Records committed batches of an import in a file of JSON lines, so an
+    interrupted import can be resumed.
+
+    The first line holds the hash of the XML content and the
+    configuration, every following line the node or relationship indices
+    of a batch about to be run, or the node indices with their database
+    ids or the relationship indices of one committed batch. Entities of
+    batches that were begun but not recorded as committed may have been
+    committed right before the interruption, recover_batches looks them
+    up in the database on resume.
+
+    In batch mode a completed import leaves a marker at done_path with
+    the first line of its journal, so that resuming an interrupted batch
+    skips the brains that were already written.
+    """
+
+    def __init__(self, path, xml_hash, cfg, done_path=None):
+        self.path = path
+        self.done_path = done_path
+        self.xml_hash = xml_hash
+        self.config = cfg.dict()
+        # committed node ids with keys node indices
+        self.node_ids = {}
+        # committed relationship indices
+        self.relationships = set()
+        # indices of entities of begun batches
+        self.begun_nodes = set()
+        self.begun_relationships = set()
+        self.lock = threading.Lock()
+        self.f = None
+
+    def start(self, restart=False):
+        """
+        Start a new journal. The journal of an interrupted import is only
+        overwritten if restart is set.
+        """
+        # journals of completed imports are removed
+        if os.path.exists(self.path) and not restart:
+            raise JournalError('Journal {} of an interrupted import exists, '
+                               'continue it with --resume or start over '
+                               'with --restart.'.format(self.path))
+        self.remove_done()
+        self.f = open(self.path, 'w')
+        self.write(self.header())
+
+    def header(self):
+        return {'xml_hash': self.xml_hash, 'config': self.config}
+
+    def check_header(self, header, path):
+        if header['xml_hash'] != self.xml_hash:
+            raise JournalError('XML file changed since journal {} was '
+                               'started.'.format(path))
+        if header['config']['Convert'] != self.config['Convert']:
+            raise JournalError('Convert options changed since journal '
+                               '{} was started.'.format(path))
+
+    def resume(self):
+        """ Load a previous journal and continue appending to it. """
+        with open(self.path) as f:
+            self.check_header(json.loads(f.readline()), self.path)
+
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # incomplete last line
+                    break
+                self.node_ids.update(entry.get('nodes', []))
+                self.relationships.update(entry.get('relationships', []))
+                self.begun_nodes.update(entry.get('begin_nodes', []))
+                self.begun_relationships.update(
+                    entry.get('begin_relationships', []))
+
+        logger.info('Resuming after {} nodes and {} relationships.'
+                    .format(len(self.node_ids), len(self.relationships)))
+        self.f = open(self.path, 'a')
+
+    def write(self, entry):
+        with self.lock:
+            self.f.write(json.dumps(entry) + '\n')
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def nodes_begun(self, rows):
+        self.write({'begin_nodes': [row['i'] for row in rows]})
+
+    def relationships_begun(self, rows):
+        self.write({'begin_relationships': [row['j'] for row in rows]})
+
+    def nodes_committed(self, rows, records):
+        self.write({'nodes': [[r['i'], r['id']] for r in records]})
+
+    def relationships_committed(self, rows, records):
+        self.write({'relationships': [row['j'] for row in rows]})
+
+    def uncertain_nodes(self):
+        """ Indices of nodes of begun batches not known to be committed. """
+        return sorted(self.begun_nodes.difference(self.node_ids))
+
+    def uncertain_relationships(self):
+        return sorted(self.begun_relationships - self.relationships)
+
+    def recovered(self, node_records, relationships):
+        """ Record entities of uncertain batches found in the database. """
+        self.node_ids.update((r['i'], r['id']) for r in node_records)
+        self.relationships.update(relationships)
+        self.write({'nodes': [[r['i'], r['id']] for r in node_records],
+                    'relationships': relationships})
+
+    def finish(self):
+        """
+        Remove the journal of a completed import, leaving the marker of
+        done_path if it is set.
+        """
+        self.f.close()
+        if self.done_path is not None:
+            with open(self.done_path, 'w') as f:
+                json.dump(self.header(), f)
+        os.remove(self.path)
+
+    def is_done(self):
+        """ Whether the marker of a completed import of the XML exists. """
+        if self.done_path is None or not os.path.exists(self.done_path):
+            return False
+        with open(self.done_path) as f:
+            self.check_header(json.load(f), self.done_path)
+        return True
+
+    def remove_done(self):
+        if self.done_path is not None and os.path.exists(self.done_path):
+            os.remove(self.done_path)
+
+
+class Rejects(object):
+    """
+    Rows that failed alone, recorded in a file of JSON lines with the
+    guids of their entities and the error. The file is only created when
+    a row is rejected, a file left by a previous run is removed.
+    """
+
+    def __init__(self, path, brain):
+        self.path = path
+        self.brain = brain
+        # indices of rejected nodes
+        self.nodes = set()
+        self.count = 0
+        self.lock = threading.Lock()
+        self.f = None
+        if os.path.exists(path):
+            os.remove(path)
+
+    def describe(self, row):
+        brain = self.brain
+        if isinstance(row, dict) and 'i' in row:
+            i = row['i']
+            self.nodes.add(i)
+            return {'node': brain.node_guids[i], 'name': brain.node_names[i]}
+        elif isinstance(row, dict) and 'j' in row:
+            j = row['j']
+            return {'relationship': brain.rel_guids[j],
+                    'type': brain.rel_types[j],
+                    'start': brain.node_guids[brain.rel_starts[j]],
+                    'end': brain.node_guids[brain.rel_ends[j]]}
+        elif isinstance(row, dict) and 'guid' in row.get('props', {}):
+            return {'guid': row['props']['guid']}
+        return {'row': row}
+
+    def reject(self, row, error):
+        entry = self.describe(row)
+        entry['error'] = str(error)
+        with self.lock:
+            if self.f is None:
+                self.f = open(self.path, 'w')
+            self.f.write(json.dumps(entry, default=str) + '\n')
+            self.f.flush()
+            self.count += 1
+
+        stats.count('rejected')
+        logger.warning('Rejected {}: {}'.format(
+            ', '.join('{} {}'.format(k, v) for k, v in entry.items()
+                      if k != 'error'), error))
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            logger.warning('{} rejected rows written to {}.'
+                           .format(self.count, self.path))
+
+
+def get_rejects(xml_file, brain, cfg):
+    """ Rejects beside xml_file, None if failed batches abort. """
+    if not cfg['Neo4j']['reject_rows']:
+        return None
+    return Rejects('{}.rejects'.format(brain_base(xml_file)), brain)
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+# extensions of compressed XML files, a .xml extension before them is
+# part of the extension as well (brain.xml.gz)
+COMPRESSED = ('.gz', '.bz2', '.xz', '.zip')
+
+
+def brain_base(xml_file):
+    """ Path of xml_file without extension, shared by its .cfg file. """
+    f, ext = os.path.splitext(xml_file)
+    if ext.lower() in COMPRESSED:
+        base, ext = os.path.splitext(f)
+        if ext.lower() == '.xml':
+            f = base
+    return f
+
+
+@contextmanager
+def open_xml(xml_file):
+    """
+    Binary file object of xml_file, decompressed on the fly if it has a
+    compression extension (the first .xml member of a .zip). Plain files
+    are memory mapped, so that the page cache is read directly.
+    """
+    ext = os.path.splitext(xml_file)[1].lower()
+    if ext == '.gz':
+        import gzip
+        with gzip.open(xml_file, 'rb') as f:
+            yield f
+    elif ext == '.bz2':
+        import bz2
+        with bz2.open(xml_file, 'rb') as f:
+            yield f
+    elif ext == '.xz':
+        import lzma
+        with lzma.open(xml_file, 'rb') as f:
+            yield f
+    elif ext == '.zip':
+        import zipfile
+        with zipfile.ZipFile(xml_file) as archive:
+            names = [name for name in archive.namelist()
+                     if name.lower().endswith('.xml')]
+            if not names:
+                raise IOError(0, 'No XML file in {}'.format(xml_file))
+            with archive.open(names[0]) as f:
+                yield f
+    else:
+        with open(xml_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # empty files cannot be mapped
+                yield f
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    yield m
+
+
+def find_nodes_statement(labels, keys):
+    return ('UNWIND $rows AS row MATCH (n{}) WHERE {} '
+            'RETURN row.i AS i, id(n) AS id'
+            .format(''.join(':' + cypher_name(label)
+                            for label in sorted(labels)),
+                    ' AND '.join('n.{0} = row.props.{0}'.format(key)
+                                 for key in keys)))
+
+
+def count_relationships_statement(rel_type):
+    return ('UNWIND $rows AS row '
+            'MATCH (a)-[r:{}]->(b) WHERE id(a) = row.a AND id(b) = row.b '
+            'RETURN row.a AS a, row.b AS b, count(r) AS n'
+            .format(cypher_name(rel_type)))
+
+
+def recover_nodes(graph, brain, indices, known_ids):
+    """
+    Records of the nodes with given indices that are in the database,
+    found by guid if brain stores guids and by name and source otherwise,
+    among the nodes whose ids are not in known_ids.
+    """
+    keys = ['guid'] if brain.store_guid else ['name']
+    if brain.source is not None:
+        keys.append('source')
+
+    records = []
+    for labels, rows in node_rows(brain, indices).items():
+        found = set()
+        for record in graph.run(find_nodes_statement(labels, keys),
+                                rows=rows).data():
+            # a thought of the same name may have been committed before
+            if record['id'] in known_ids or record['i'] in found:
+                continue
+            known_ids.add(record['id'])
+            found.add(record['i'])
+            records.append(record)
+
+    return records
+
+
+def recover_relationships(graph, brain, indices, node_ids, committed):
+    """
+    Those of the relationships with given indices that are in the
+    database. Relationships with the same type and endpoints are told
+    apart by counting the ones among committed.
+    """
+    def key(j):
+        return (brain.rel_types[j], node_ids[brain.rel_starts[j]],
+                node_ids[brain.rel_ends[j]])
+
+    # endpoints of rejected nodes have no id, nothing to find
+    uncertain = {}
+    for j in indices:
+        if None not in key(j)[1:]:
+            uncertain.setdefault(key(j), []).append(j)
+
+    counts = {}
+    for rel_type in set(k[0] for k in uncertain):
+        rows = [{'a': a, 'b': b} for t, a, b in uncertain if t == rel_type]
+        for r in graph.run(count_relationships_statement(rel_type),
+                           rows=rows).data():
+            counts[rel_type, r['a'], r['b']] = r['n']
+    for j in committed:
+        k = key(j)
+        if k in counts:
+            counts[k] -= 1
+
+    found = []
+    for k, js in uncertain.items():
+        found.extend(js[:max(0, counts.get(k, 0))])
+    return sorted(found)
+
+
+@timed
+def recover_batches(graph, brain, journal):
+    """
+    Record in journal the entities of batches begun by an interrupted
+    import that were committed before they could be recorded, so that
+    resuming does not write them twice.
+    """
+    nodes = journal.uncertain_nodes()
+    relationships = journal.uncertain_relationships()
+    if not nodes and not relationships:
+        return
+
+    logger.info('Looking up {} nodes and {} relationships of unrecorded '
+                'batches.'.format(len(nodes), len(relationships)))
+    node_records = recover_nodes(graph, brain, nodes,
+                                 set(journal.node_ids.values()))
+
+    node_ids = [journal.node_ids.get(i) for i in range(brain.node_count())]
+    for record in node_records:
+        node_ids[record['i']] = record['id']
+    found = recover_relationships(graph, brain, relationships, node_ids,
+                                  journal.relationships)
+    journal.recovered(node_records, found)
+    logger.info('Found {} nodes and {} relationships of unrecorded batches.'
+                .format(len(node_records), len(found)))
+
+
+def done_path(xml_file):
+    return '{}.done'.format(brain_base(xml_file))
+
+
+def get_journal(xml_file, cfg, xml_hash=None, batch=False):
+    """
+    Journal beside xml_file. In batch mode completed imports leave a
+    marker, see Journal.
+    """
+    if xml_hash is None:
+        xml_hash = file_hash(xml_file)
+    return Journal('{}.journal'.format(brain_base(xml_file)), xml_hash, cfg,
+                   done_path(xml_file) if batch else None)
+
+
+def update_type(id1, id2, types, brain):
+    """ Label the node linked to a type, False if neither end is a type. """
+    node_index = brain.node_index
+    if id1 in types and id2 in node_index:
+        brain.add_label(node_index[id2], types[id1])
+    elif id2 in types and id1 in node_index:
+        brain.add_label(node_index[id1], types[id2])
+    else:
+        return False
+
+    return True
+
+
+# ISO 8601 UTC offsets (-05:00) with keys Brain offsets (-0500)
+utc_offsets = {}
+
+
+def brain_datetime(timestamp):
+    """
+    ISO 8601 form of a Brain timestamp, 2016-01-13 15:03:30.201 @-0500
+    becomes 2016-01-13T15:03:30.201-05:00. Only the offset needs parsing
+    and brains use few offsets, so they are cached.
+    """
+    if timestamp is None:
+        return None
+
+    local, _, offset = timestamp.partition(' @')
+    utc_offset = utc_offsets.get(offset)
+    if utc_offset is None:
+        utc_offset = offset[:3] + ':' + offset[3:] if len(offset) == 5 \
+            else ''
+        utc_offsets[offset] = utc_offset
+
+    return local[:10] + 'T' + local[11:] + utc_offset
 
 
 def is_private(access_control_type):
@@ -50,8 +1148,8 @@ def is_private(access_control_type):
 def ignore_thought(thought, cfg):
     # ignore forgotten thoughts or private thoughts if configuration
     # requires it
-    forgotten = thought.find('forgottenDateTime') is not None
-    access_control_type = thought.find('accessControlType').text
+    forgotten = thought.forgotten
+    access_control_type = thought.access_control_type
 
     ignore_private = cfg['Convert']['ignore_private']
     ignore_forgotten = cfg['Convert']['ignore_forgotten']
@@ -85,18 +1183,18 @@ def is_sibling_dir(direction):
 
 
 def is_backward_link(link):
-    return link.find('isBackward').text == '1'
+    return link.is_backward == '1'
 
 
 def is_directed_link(link):
     # if 2 link can be traversed both ways in the Brain,
     # but not when 3 (in Neo4j there is no difference)
-    strength = link.find('strength').text
+    strength = link.strength
     return strength == '2' or strength == '3'
 
 
 def is_2way_link(link):
-    direction = link.find('dir').text
+    direction = link.dir
     return is_sibling_dir(direction) and not is_directed_link(link)
 
 
@@ -105,19 +1203,24 @@ def is_2way_mode(siblmode):
 
 
 def is_link_type(link):
-    return link.find('isType').text == '1'
+    return link.is_type == '1'
 
 
 def is_thought_type(thought):
     # 1 type, 3 label, 2?
-    return thought.find('isType').text != '0'
+    return thought.is_type != '0'
 
 
 def get_graph(cfg):
+    from py2neo import Graph, GraphError
+
     neo4j_uri = cfg['Neo4j']['neo4j_uri']
 
     try:
-        if neo4j_uri != '':
+        if neo4j_uri.startswith('bolt'):
+            from .bolt import BoltGraph
+            return BoltGraph(neo4j_uri, cfg)
+        elif neo4j_uri != '':
             return Graph(neo4j_uri)
         else:
             return Graph()
@@ -140,6 +1243,57 @@ def verify_empty(graph):
         app_exit(0)
 
 
+def child_text(element, tag):
+    child = element.find(tag)
+    return None if child is None else child.text
+
+
+def thought_record(thought):
+    return ThoughtRecord(
+        guid=child_text(thought, 'guid'),
+        name=child_text(thought, 'name'),
+        is_type=child_text(thought, 'isType'),
+        forgotten=thought.find('forgottenDateTime') is not None,
+        access_control_type=child_text(thought, 'accessControlType'),
+        modified=child_text(thought, 'realModificationDateTime'),
+        created=child_text(thought, 'creationDateTime'),
+        activated=child_text(thought, 'activationDateTime'))
+
+
+def link_record(link):
+    return LinkRecord(
+        guid=child_text(link, 'guid'),
+        ida=child_text(link, 'idA'),
+        idb=child_text(link, 'idB'),
+        dir=child_text(link, 'dir'),
+        is_backward=child_text(link, 'isBackward'),
+        strength=child_text(link, 'strength'),
+        name=child_text(link, 'name'),
+        is_type=child_text(link, 'isType'),
+        link_type_id=child_text(link, 'linkTypeID'),
+        modified=child_text(link, 'modificationDateTime'),
+        created=child_text(link, 'creationDateTime'))
+
+
+def attachment_record(attachment):
+    return AttachmentRecord(
+        object_id=child_text(attachment, 'objectID'),
+        attachment_type=child_text(attachment, 'attachmentType'),
+        location=child_text(attachment, 'location'))
+
+
+def is_stream_parser(parser):
+    return parser == 'stream'
+
+
+def is_expat_parser(parser):
+    return parser == 'expat'
+
+
+def is_sharded_parser(parser):
+    return parser == 'sharded'
+
+
 def is_url(attachment_type):
     return attachment_type == '3'
 
@@ -152,7 +1306,8 @@ def ignore_attachments(cfg):
     return cfg['Convert']['ignore_attachments']
 
 
-def parse_attachments(root, nodes, cfg):
+@timed
+def parse_attachments(root, brain, cfg):
     """
     attachment attributes - only attributes with * are parsed
     --------------------------------------------------------------------------
@@ -179,16 +1334,22 @@ def parse_attachments(root, nodes, cfg):
 
     logger.info('Parsing Attachments.')
     for attachment in attachments:
-        attachment_type = attachment.find('attachmentType').text
-        location = attachment.find('location').text
-        object_id = attachment.find('objectID').text
+        add_attachment(attachment_record(attachment), brain)
+
+
+def add_attachment(attachment, brain):
+    # attachments of ignored thoughts or types have no node
+    i = brain.node_index.get(attachment.object_id)
+    if i is None:
+        return
 
-        if is_url(attachment_type):
-            nodes[object_id]['URL'] = location
-        elif is_path(attachment_type):
-            nodes[object_id]['path'] = location
+    if is_url(attachment.attachment_type):
+        brain.set_property(i, 'URL', attachment.location)
+    elif is_path(attachment.attachment_type):
+        brain.set_property(i, 'path', attachment.location)
 
 
+@timed
 def parse_thoughts(root, cfg):
     """
     thought attributes - only attributes with * are parsed
@@ -200,7 +1361,7 @@ def parse_thoughts(root, cfg):
     | label                       | Non empty for types and labels,          |
     |                             | same as name                             |
     | creationDateTime            | timestamp                                |
-    | realModificationDateTime    | timestamp                                |
+    | realModificationDateTime*   | timestamp                                |
     | displayModificationDateTime | timestamp                                |
     | forgottenDateTime           | timestamp                                |
     | deletedDateTime             | timestamp                                |
@@ -213,45 +1374,64 @@ def parse_thoughts(root, cfg):
     """
 
     thoughts = root.find('Thoughts').findall('Thought')
-    # nodes is a dictionary of Node values with keys guid values
-    nodes = {}
+    # brain holds converted nodes (and relationships later on)
+    brain = new_brain(cfg)
     # types is a dictionary of thought type names with keys guid values
     types = {}
 
     logger.info('Parsing Thoughts.')
     for thought in thoughts:
-        name = thought.find('name').text
-        guid = thought.find('guid').text
+        add_thought(thought_record(thought), brain, types, cfg)
 
-        # ignore forgotten thoughts
-        if not ignore_thought(thought, cfg):
-            name = html.unescape(name)
+    return brain, types
 
-            if is_thought_type(thought):
-                types[guid] = name
-            else:
-                nodes[guid] = Node(name=name)
 
-    return nodes, types
+def new_brain(cfg):
+    node_index = None
+    threshold = cfg['Parse']['spill_threshold']
+    if threshold:
+        from .spill import GuidIndex
+        node_index = GuidIndex(threshold, cfg['Parse']['spill_cache'])
+    return Brain(store_guid(cfg), import_timestamps(cfg), node_index)
 
 
-def parse_link_types(root, cfg):
-    upper_link_names = cfg['Convert']['upper_link_names']
+def new_pending(cfg):
+    """ List for records kept until the end of a section. """
+    threshold = cfg['Parse']['spill_threshold']
+    if threshold:
+        from .spill import SpillList
+        return SpillList(threshold)
+    return []
 
-    links = root.find('Links').findall('Link')
 
-    # link_types is a dictionary of link type names with keys guid values
-    link_types = {}
+def import_timestamps(cfg):
+    return cfg['Convert']['timestamps']
 
-    logger.info('Parsing Link Types.')
-    for link in links:
-        guid = link.find('guid').text
-        name = link.find('name').text
 
-        if is_link_type(link):
-            link_types[guid] = link_name(name, upper_link_names)
+def store_guid(cfg):
+    return cfg['Convert']['store_guid'] or cfg['Neo4j']['incremental'] \
+        or is_schema(cfg)
+
 
-    return link_types
+def add_thought(thought, brain, types, cfg):
+    stats.count('thoughts')
+
+    # ignore forgotten thoughts
+    if not ignore_thought(thought, cfg):
+        name = html.unescape(thought.name)
+
+        if is_thought_type(thought):
+            stats.count('types')
+            types[thought.guid] = sys.intern(name)
+        else:
+            times = None
+            if brain.timestamps:
+                times = (thought.created, thought.modified, thought.activated)
+            i = brain.add_node(thought.guid, name, thought.modified, times)
+            if is_schema(cfg):
+                brain.add_label(i, cfg['Neo4j']['thought_label'])
+    else:
+        stats.count('thoughts_ignored')
 
 
 def get_relation_name(link, link_types, cfg):
@@ -259,9 +1439,9 @@ def get_relation_name(link, link_types, cfg):
     tree_neoname = cfg['Convert']['tree_neoname']
     sibl_neoname = cfg['Convert']['sibl_neoname']
 
-    name = link.find('name').text
-    link_typeid = link.find('linkTypeID').text
-    direction = link.find('dir').text
+    name = link.name
+    link_typeid = link.link_type_id
+    direction = link.dir
 
     if name is not None:
         return link_name(name, upper_link_names)
@@ -276,9 +1456,9 @@ def get_relation_name(link, link_types, cfg):
 def get_order(link, cfg):
     tree_neodir = cfg['Convert']['tree_neodir']
 
-    ida = link.find('idA').text
-    idb = link.find('idB').text
-    direction = link.find('dir').text
+    ida = link.ida
+    idb = link.idb
+    direction = link.dir
 
     if is_tree_dir(direction):
         # is configured direction of tree links the same as the direction
@@ -296,7 +1476,8 @@ def get_order(link, cfg):
         return None, None  # link is type
 
 
-def parse_regular_links(root, link_types, nodes, types, cfg):
+@timed
+def parse_links(root, brain, types, cfg):
     """
     link attributes - only attributes with * are parsed
     --------------------------------------------------------------------------
@@ -310,7 +1491,7 @@ def parse_regular_links(root, link_types, nodes, types, cfg):
     | labelForward         | ? (empty by default)                            |
     | labelBackward        | ? (empty by default)                            |
     | creationDateTime     | timestamp                                       |
-    | modificationDateTime | timestamp                                       |
+    | modificationDateTime*| timestamp                                       |
     | deletedDateTime      | timestamp                                       |
     | followDateTime       | timestamp                                       |
     | isType*              | is link a type                                  |
@@ -323,60 +1504,375 @@ def parse_regular_links(root, link_types, nodes, types, cfg):
 
     links = root.find('Links').findall('Link')
 
-    # relationships is a dictionary of Relationship values
-    # with keys guid values
-    relationships = {}
+    converter = LinkConverter(brain, types, cfg)
 
-    mode_2way = is_2way_mode(cfg['Convert']['sibl_mode'])
-
-    logger.info('Parsing Regular Links.')
+    logger.info('Parsing Links.')
     for link in links:
-        # ignore type links
+        converter.add(link_record(link))
+
+    return converter.finish()
+
+
+class LinkConverter(object):
+    """
+    Converts Link records to relationships in a single pass.
+
+    Type links are collected as they come. Regular links are converted
+    immediately, unless their name comes from a link type that has not
+    been seen yet, in which case they are kept until finish is called.
+    """
+
+    def __init__(self, brain, types, cfg):
+        self.brain = brain
+        self.types = types
+        self.cfg = cfg
+        self.upper_link_names = cfg['Convert']['upper_link_names']
+        self.mode_2way = is_2way_mode(cfg['Convert']['sibl_mode'])
+        # link_types is a dictionary of link type names with keys guid values
+        self.link_types = {}
+        # regular links waiting for their link type
+        self.pending = new_pending(cfg)
+
+    def add(self, link):
+        stats.count('links')
         if is_link_type(link):
+            stats.count('link_types')
+            self.link_types[link.guid] = link_name(link.name,
+                                                   self.upper_link_names)
+        elif self.is_pending(link):
+            self.pending.append(link)
+        else:
+            self.add_regular(link)
+
+    def is_pending(self, link):
+        return link.name is None and link.link_type_id is not None \
+            and link.link_type_id not in self.link_types
+
+    def add_regular(self, link):
+        add_regular_link(link, self.link_types, self.brain, self.types,
+                         self.mode_2way, self.cfg)
+
+    def finish(self):
+        if self.pending:
+            logger.info('Resolving {} Links with late link types.'
+                        .format(len(self.pending)))
+        for link in self.pending:
+            self.add_regular(link)
+        self.pending = []
+
+        return self.brain
+
+
+def add_regular_link(link, link_types, brain, types, mode_2way, cfg):
+    # decide relation name
+    rel_type = get_relation_name(link, link_types, cfg)
+
+    # decide order of connected thoughts
+    id1, id2 = get_order(link, cfg)
+
+    guid = link.guid
+    try:
+        i1 = brain.node_index[id1]
+        i2 = brain.node_index[id2]
+    except KeyError:
+        # might occur for ignored thoughts or connections with types
+        if update_type(id1, id2, types, brain):
+            stats.count('type_links')
+        else:
+            stats.count('links_dropped')
+        return
+
+    times = (link.created, link.modified) if brain.timestamps else None
+    brain.add_relationship(guid, i1, rel_type, i2, link.modified, times)
+    if is_2way_link(link) and mode_2way:
+        brain.add_relationship(guid + '-B', i2, rel_type, i1, link.modified,
+                               times)
+
+
+def iterparse_brain(source):
+    """
+    Yield (section, element) for every element that is a direct child of a
+    BrainData section (Thought, Link, Attachment, ...).
+
+    Elements are cleared as soon as the consumer asks for the next one, so
+    the document is never held in memory as a whole. Consumers must copy
+    what they need out of an element before advancing.
+    """
+    # path holds the currently open elements from BrainData downwards
+    path = []
+    for event, element in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            path.append(element)
             continue
 
-        # decide relation name
-        rel_type = get_relation_name(link, link_types, cfg)
+        path.pop()
+        if len(path) == 2:
+            yield path[1].tag, element
+            # drop the handled element (and any preceding ones)
+            path[1].clear()
+        elif len(path) == 1:
+            path[0].clear()
 
-        # decide order of connected thoughts
-        id1, id2 = get_order(link, cfg)
 
-        guid = link.find('guid').text
-        try:
-            relationships[guid] = Relationship(nodes[id1], rel_type,
-                                               nodes[id2])
-            if is_2way_link(link) and mode_2way:
-                relationships[guid+'-B'] = Relationship(nodes[id2], rel_type,
-                                                        nodes[id1])
-        except KeyError:
-            # might occur for ignored thoughts or connections with types
-            update_type(id1, id2, types, nodes)
+def element_records(source, with_attachments=True):
+    """
+    Yield (tag, record) for every Thought, Link and Attachment (if
+    with_attachments is set) of a Brain XML file, and ('Source', guid)
+    for the guid of its Source.
+    """
+    for section, element in iterparse_brain(source):
+        tag = element.tag
+        if tag == 'Thought':
+            yield tag, thought_record(element)
+        elif tag == 'Link':
+            yield tag, link_record(element)
+        elif tag == 'Attachment' and with_attachments:
+            yield tag, attachment_record(element)
+        elif tag == 'guid' and section == 'Source':
+            yield 'Source', element.text
+
+
+def convert_records(records, cfg):
+    """ Convert (tag, record) pairs in document order to a Brain. """
+    brain = new_brain(cfg)
+    types = {}
+    # Links come after Thoughts in Brain XML, so nodes and types are
+    # complete by the time links are converted
+    links = LinkConverter(brain, types, cfg)
+
+    source_guid = None
+    for tag, record in records:
+        if tag == 'Thought':
+            add_thought(record, brain, types, cfg)
+        elif tag == 'Link':
+            links.add(record)
+        elif tag == 'Attachment':
+            add_attachment(record, brain)
+        else:
+            source_guid = record
 
-    return relationships
+    return namespace_brain(links.finish(), source_guid, cfg)
 
 
-def store2neo(root, cfg):
+@timed
+def stream_brain(source, cfg):
+    """
+    Convert a Brain XML file to a Brain in a single streaming pass. Result
+    is the same as parsing the whole tree with parse_thoughts,
+    parse_attachments and parse_links.
+    """
+    logger.info('Streaming Thoughts, Links and Attachments.')
+    records = element_records(source, not ignore_attachments(cfg))
+    return convert_records(records, cfg)
+
+
+@timed
+def expat_brain(source, cfg):
+    """
+    Same as stream_brain, but records are read by the event driven
+    parser of brain2neo.fastparse instead of ElementTree.
+    """
+    from .fastparse import expat_records
+
+    logger.info('Parsing Thoughts, Links and Attachments with expat.')
+    records = expat_records(source, not ignore_attachments(cfg))
+    return convert_records(records, cfg)
+
+
+def parse_root(root, cfg):
+    brain, types = parse_thoughts(root, cfg)
+
+    parse_attachments(root, brain, cfg)
+
+    brain = parse_links(root, brain, types, cfg)
+
+    return namespace_brain(brain, root.findtext('Source/guid'), cfg)
+
+
+def source_label(source):
+    return 'Source_{}'.format(source)
+
+
+def namespace_brain(brain, source, cfg):
+    """
+    Mark nodes of brain with the guid of its Source element, as a source
+    property or a Source_<guid> label, depending on source_namespace.
+    """
+    namespace = cfg['Convert']['source_namespace']
+    if source is None or namespace == 'none':
+        return brain
+
+    if namespace == 'property':
+        brain.source = source
+    else:
+        label = brain.source_label = source_label(source)
+        for i in range(brain.node_count()):
+            brain.add_label(i, label)
+
+    return brain
+
+
+def is_incremental(cfg):
+    return cfg['Neo4j']['incremental']
+
+
+def is_schema(cfg):
+    return cfg['Neo4j']['schema']
+
+
+def is_pipelined(cfg):
+    return cfg['Neo4j']['pipelined'] and not is_incremental(cfg)
+
+
+def prepare_graph(cfg, resume=False):
     # Creates a py2neo Graph object (does not connect to db yet)
     graph = get_graph(cfg)
 
-    verify_empty(graph)
+    # an incremental import updates what a previous run stored and
+    # a resumed one continues it
+    if not is_incremental(cfg) and not resume:
+        verify_empty(graph)
 
-    nodes, types = parse_thoughts(root, cfg)
+    return graph
 
-    parse_attachments(root, nodes, cfg)
 
-    link_types = parse_link_types(root, cfg)
+def write_entities(graph, brain, cfg, journal=None, rejects=None):
+    if is_incremental(cfg):
+        from . import incremental
+        incremental.update_entities(graph, brain, cfg, rejects)
+    else:
+        store_entities(graph, brain, cfg, journal, rejects=rejects)
+
+
+def store2neo(root, cfg):
+    graph = prepare_graph(cfg)
+
+    brain = parse_root(root, cfg)
 
-    relationships = parse_regular_links(root, link_types, nodes, types, cfg)
+    write_entities(graph, brain, cfg)
+
+
+def read_brain(xml_file, cfg, xml_hash=None):
+    """
+    Convert xml_file to a Brain with parse_brain, or load it from the
+    cache of a previous conversion with the same options. xml_hash is the
+    file_hash of xml_file if the caller already has it.
+    """
+    from .cache import get_cache, cache_key
+
+    cache = get_cache(cfg)
+    if cache is None:
+        return parse_brain(xml_file, cfg)
+
+    if xml_hash is None:
+        xml_hash = file_hash(xml_file)
+    key = cache_key(xml_hash, cfg)
+    brain = cache.load(key)
+    if brain is not None:
+        logger.info('Loaded converted brain of {} from cache.'
+                    .format(xml_file))
+        return brain
+
+    brain = parse_brain(xml_file, cfg)
+    cache.store(key, brain)
+    return brain
+
+
+def parse_brain(xml_file, cfg):
+    """ Convert xml_file to a Brain with the configured parser. """
+    parser = cfg['Parse']['parser']
+    if is_stream_parser(parser):
+        logger.info('Streaming XML {}.'.format(xml_file))
+        with open_xml(xml_file) as f:
+            return stream_brain(f, cfg)
+    elif is_expat_parser(parser):
+        logger.info('Reading XML {} with expat.'.format(xml_file))
+        with open_xml(xml_file) as f:
+            return expat_brain(f, cfg)
+    elif is_sharded_parser(parser):
+        from .shard import sharded_brain
+        return sharded_brain(xml_file, cfg)
+
+    logger.info('Getting root element from XML {}.'.format(xml_file))
+    return parse_root(get_root(xml_file), cfg)
+
+
+def file2neo(xml_file, cfg, resume=False, restart=False):
+    """
+    Same as store2neo but reads xml_file with read_brain. Committed
+    batches are recorded in a journal beside xml_file, and if resume is
+    set, the batches recorded by an interrupted run are skipped. The
+    journal of an interrupted run is only discarded if restart is set.
+    """
+    if is_pipelined(cfg):
+        if resume:
+            raise JournalError('Pipelined imports are not journaled '
+                               'and cannot be resumed.')
+        from .pipeline import pipeline2neo
+        pipeline2neo(xml_file, cfg)
+        return
+
+    # the database is checked before a journal is touched
+    graph = prepare_graph(cfg, resume)
+
+    journal = None
+    xml_hash = None
+    if not is_incremental(cfg):
+        journal = get_journal(xml_file, cfg)
+        xml_hash = journal.xml_hash
+        if resume:
+            journal.resume()
+        else:
+            journal.start(restart)
+
+    # the journal and the cache share the hash of the XML file
+    brain = read_brain(xml_file, cfg, xml_hash)
+
+    rejects = get_rejects(xml_file, brain, cfg)
+    write_entities(graph, brain, cfg, journal, rejects)
+
+    if journal is not None:
+        journal.finish()
+    if rejects is not None:
+        rejects.close()
+
+
+def get_pool(graph, cfg):
+    workers = cfg['Neo4j']['workers']
+    graphs = [graph] + [get_graph(cfg) for _ in range(workers - 1)]
+    return GraphPool(graphs)
+
+
+def store_entities(graph, brain, cfg, journal=None, pool=None,
+                   rejects=None):
+    sizer = BatchSizer(cfg, rejects)
+
+    node_ids = [None] * brain.node_count()
+    rel_indices = range(brain.relationship_count())
+    if journal is not None:
+        recover_batches(graph, brain, journal)
+        # skip entities committed before a resume
+        for i, node_id in journal.node_ids.items():
+            node_ids[i] = node_id
+        rel_indices = [j for j in rel_indices
+                       if j not in journal.relationships]
+    node_indices = [i for i, node_id in enumerate(node_ids)
+                    if node_id is None]
 
     logger.info('Creating graph entities.')
-    logger.info('Creating {} nodes.'.format(len(nodes)))
-    create_entities(graph, nodes)
-    logger.info('Creating {} relationships.'.format(len(relationships)))
-    create_entities(graph, relationships)
+    logger.info('Creating {} nodes.'.format(len(node_indices)))
+    create_nodes(graph, brain, node_indices, node_ids, sizer, journal)
+    create_schema(graph, brain, cfg)
+    logger.info('Creating {} relationships.'.format(len(rel_indices)))
+    if pool is None:
+        pool = get_pool(graph, cfg)
+    create_relationships(graph, brain, rel_indices, node_ids, sizer, pool,
+                         journal)
 
 
 def print_validation_errors(config, res):
+    from configobj import flatten_errors
+
     for entry in flatten_errors(config, res):
         # each entry is a tuple
         section_list, key, error = entry
@@ -395,6 +1891,9 @@ def get_cfg_obj(cfg_file, cfg_specfile):
         raise ValueError('Configuration file is the same as specification '
                          'file: {}.'.format(cfgspecfile))
 
+    from configobj import ConfigObj
+    from validate import Validator
+
     config = ConfigObj(cfg_file, configspec=cfg_specfile, file_error=True)
 
     validator = Validator()
@@ -411,10 +1910,8 @@ def get_cfg_obj(cfg_file, cfg_specfile):
 
 def get_cfg(xml_file):
     # get name, ignore extension
-    f, _ = os.path.splitext(xml_file)
-    cfg_file = '{}.cfg'.format(f)
-    cfg_specfile = resource_filename(__name__,
-                                     os.path.join('spec', 'specification.cfg'))
+    cfg_file = '{}.cfg'.format(brain_base(xml_file))
+    cfg_specfile = SPEC_FILE
 
     if not os.path.isfile(cfg_file):
         logger.warning('Warning configuration file {} does not exist'
@@ -433,8 +1930,10 @@ def get_cfg(xml_file):
     return get_cfg_obj(cfg_file, cfg_specfile)
 
 
+@timed
 def get_root(xml_file):
-    tree = parse(xml_file)
+    with open_xml(xml_file) as f:
+        tree = parse(f)
     return tree.getroot()
 
 
@@ -467,31 +1966,102 @@ def main():
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('-f', '--file', help='Brain XML file to be parsed',
-                        required=True)
+    parser.add_argument('-f', '--file', required=True,
+                        help='Brain XML file to be parsed, or a directory '
+                             'or glob pattern of several files')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='processes converting several files '
+                             '(default number of CPUs)')
     parser.add_argument('-v', '--verbose', action='count',
                         help='increase output verbosity')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted import from its '
+                             'journal')
+    parser.add_argument('--restart', action='store_true',
+                        help='start over, discarding the journal of an '
+                             'interrupted import')
+    parser.add_argument('--stats', metavar='FILE',
+                        help='write timers and counters of the run to '
+                             'FILE as JSON')
+    parser.add_argument('--memory', action='store_true',
+                        help='sample peak memory of each phase (slower)')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='dump a cProfile profile of each phase '
+                             'to DIR')
+    parser.add_argument('--output-csv', metavar='DIR',
+                        help='write neo4j-admin import CSV files to DIR '
+                             'instead of writing to database')
+    parser.add_argument('--output-index', metavar='DIR',
+                        help='write a graph index for offline queries '
+                             '(brain2neo.index) to DIR instead of writing '
+                             'to database, requires NumPy')
 
     args = parser.parse_args()
 
     setup_logging(args)
 
-    xml_file = args.file
-    logger.info('Getting root element from XML {}.'.format(xml_file))
+    if os.path.isfile(args.file):
+        xml_files = [args.file]
+    else:
+        from . import batch
+        xml_files = batch.xml_files(args.file)
+        if not xml_files:
+            fatal_error('No XML files found in {}'.format(args.file))
+
+    cfgs = {}
+    for xml_file in xml_files:
+        logger.info('Getting configuration of XML {}.'.format(xml_file))
+        try:
+            cfgs[xml_file] = get_cfg(xml_file)
+        except IOError as e:
+            fatal_error('I/O error({0}): {1}'.format(e.errno, e.strerror))
+
+    stats.start(args.memory, args.profile)
+    try:
+        if len(cfgs) == 1:
+            xml_file, cfg = cfgs.popitem()
+            run_file(args, xml_file, cfg)
+        else:
+            run_files(args, cfgs)
+    finally:
+        if args.stats is not None:
+            stats.write(args.stats)
+        stats.dump_profiles()
+
+
+def run_file(args, xml_file, cfg):
     try:
-        root = get_root(xml_file)
+        if args.output_csv is not None:
+            from . import export
+            brain = read_brain(xml_file, cfg)
+            export.write_csv(args.output_csv, brain)
+        elif args.output_index is not None:
+            from .index import GraphIndex
+            brain = read_brain(xml_file, cfg)
+            GraphIndex.from_brain(brain).save(args.output_index)
+        else:
+            file2neo(xml_file, cfg, args.resume, args.restart)
     except ParseError as e:
         fatal_error('Error while parsing {0}: {1}'.format(xml_file, e))
     except IOError as e:
         fatal_error('I/O error({0}): {1}'.format(e.errno, e.strerror))
+    except JournalError as e:
+        fatal_error(str(e))
 
-    logger.info('Getting configuration of XML {}.'.format(xml_file))
-    try:
-        cfg = get_cfg(xml_file)
-    except IOError as e:
-        fatal_error('I/O error({0}): {1}'.format(e.errno, e.strerror))
 
-    store2neo(root, cfg)
+def run_files(args, cfgs):
+    from .batch import convert_files
+
+    if args.output_index is not None:
+        fatal_error('An index is written for a single file.')
+
+    if args.output_csv is None and any(map(is_incremental, cfgs.values())):
+        fatal_error('Incremental mode converts a single file.')
+
+    errors = convert_files(cfgs, args.jobs, args.resume, args.output_csv,
+                           args.restart)
+    if errors:
+        fatal_error('{} of {} files failed.'.format(len(errors), len(cfgs)))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+"""brain2neo.cache: converted brains cached on disk.
+
+A converted Brain depends only on the XML file and on the options that
+shape the conversion, so it is cached under a key made of the hash of
+the XML file, these options and the cache format. Later runs that only
+differ in the database or the write options load it instead of parsing
+the XML again.
+
+Cached brains are pickled and unpickled straight from the file. Files
+that no longer unpickle, e.g. written by another version of brain2neo,
+are cache misses.
+Loading a brain marks its file as recently used, and the least recently
+used files are evicted once the cache outgrows its size limit.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+import logging as log
+
+from .stats import stats, timed
+
+
+logger = log.getLogger('brain2neo')
+
+SUFFIX = '.brain'
+
+# changed whenever Brain changes, so that older cached brains are not
+# loaded
+CACHE_FORMAT = 1
+
+
+def brain_options(cfg):
+    """ Options that change the converted brain of an XML file. """
+    neo4j_cfg = cfg['Neo4j']
+    options = dict(cfg['Convert'])
+    options['incremental'] = neo4j_cfg['incremental']
+    options['schema'] = neo4j_cfg['schema']
+    options['thought_label'] = neo4j_cfg['thought_label']
+    return options
+
+
+def cache_key(xml_hash, cfg):
+    text = json.dumps([CACHE_FORMAT, xml_hash, brain_options(cfg)],
+                      sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class BrainCache(object):
+    """ Directory of pickled brains with a size limit in bytes. """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    @timed
+    def load(self, key):
+        """ Cached brain of key, None if there is none. """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                brain = pickle.load(f)
+        except (IOError, ValueError, pickle.UnpicklingError, EOFError,
+                AttributeError, ImportError, TypeError) as e:
+            if os.path.exists(path):
+                logger.warning('Ignoring unreadable cached brain {}: {}'
+                               .format(path, e))
+            stats.count('cache_misses')
+            return None
+
+        # modification time orders files for eviction, access time is
+        # not updated on every file system
+        os.utime(path)
+        stats.count('cache_hits')
+        return brain
+
+    @timed
+    def store(self, key, brain):
+        # write to a temporary file first, so that concurrent runs never
+        # see a partial file
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(brain, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """ Remove least recently used brains beyond the size limit. """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        # the newest brain is kept even if it exceeds the limit alone
+        for _, size, name in sorted(entries)[:-1]:
+            if total <= self.max_bytes:
+                break
+            logger.info('Evicting cached brain {}.'.format(name))
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+
+def get_cache(cfg):
+    """ BrainCache of the Parse section, None if caching is disabled. """
+    parse_cfg = cfg['Parse']
+    if parse_cfg['cache_dir'] == '':
+        return None
+
+    return BrainCache(parse_cfg['cache_dir'],
+                      parse_cfg['cache_size'] * 2 ** 20)
@@ -0,0 +1,96 @@
+"""brain2neo.export: offline export of converted brains to CSV files.
+
+The files follow the header format of neo4j-admin import, so a new
+database can be bulk loaded without a running server:
+
+    $ neo4j-admin import --nodes=DIR/nodes.csv \
+        --relationships=DIR/relationships.csv --multiline-fields=true
+"""
+
+import os
+import csv
+import logging as log
+
+from .brain2neo import NODE_TIMESTAMPS, REL_TIMESTAMPS
+
+logger = log.getLogger('brain2neo')
+
+NODES_FILE = 'nodes.csv'
+RELATIONSHIPS_FILE = 'relationships.csv'
+
+# separator of array values, used for labels
+ARRAY_DELIMITER = ';'
+
+# properties holding ISO 8601 timestamps
+TEMPORAL_KEYS = frozenset(NODE_TIMESTAMPS + REL_TIMESTAMPS)
+
+
+def property_keys(properties):
+    """ Sorted union of keys of property dicts, name always first. """
+    keys = set()
+    for props in properties:
+        keys.update(props.keys())
+
+    return sorted(keys, key=lambda k: (k != 'name', k))
+
+
+def header(keys):
+    """ Column names of property keys, typing timestamp columns. """
+    return [k + ':datetime' if k in TEMPORAL_KEYS else k for k in keys]
+
+
+def write_nodes(path, brain):
+    """
+    Write nodes of brain to CSV with an :ID column holding the thought
+    guid and a :LABEL column.
+    """
+    n_nodes = brain.node_count()
+    keys = property_keys(brain.node_properties(i) for i in range(n_nodes))
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([':ID'] + header(keys) + [':LABEL'])
+        for i in range(n_nodes):
+            props = brain.node_properties(i)
+            writer.writerow([brain.node_guids[i]]
+                            + [props.get(k) for k in keys]
+                            + [ARRAY_DELIMITER.join(
+                                sorted(brain.node_labels[i]))])
+
+
+def write_relationships(path, brain):
+    """
+    Write relationships of brain to CSV with :START_ID and :END_ID columns
+    holding thought guids and a :TYPE column.
+    """
+    n_relationships = brain.relationship_count()
+    guids = brain.node_guids
+    keys = property_keys(brain.relationship_properties(j)
+                         for j in range(n_relationships))
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([':START_ID'] + header(keys) + [':END_ID', ':TYPE'])
+        for j in range(n_relationships):
+            props = brain.relationship_properties(j)
+            writer.writerow([guids[brain.rel_starts[j]]]
+                            + [props.get(k) for k in keys]
+                            + [guids[brain.rel_ends[j]], brain.rel_types[j]])
+
+
+def write_csv(output_dir, brain):
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    nodes_file = os.path.join(output_dir, NODES_FILE)
+    relationships_file = os.path.join(output_dir, RELATIONSHIPS_FILE)
+
+    logger.info('Writing {} nodes to {}.'
+                .format(brain.node_count(), nodes_file))
+    write_nodes(nodes_file, brain)
+    logger.info('Writing {} relationships to {}.'
+                .format(brain.relationship_count(), relationships_file))
+    write_relationships(relationships_file, brain)
+    logger.info('Import with: neo4j-admin import --nodes={} '
+                '--relationships={} --multiline-fields=true'
+                .format(nodes_file, relationships_file))
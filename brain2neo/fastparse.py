@@ -0,0 +1,160 @@
+"""brain2neo.fastparse: Brain XML records read with expat.
+
+ElementTree builds an element for every child of a thought or link and
+records are then extracted with one find per field, each a scan over
+15+ children most of which are never used. Here records are filled in
+directly from expat events in a single pass, keeping only the text of
+the fields that are converted.
+
+Records are the same as the ones built from elements by thought_record,
+link_record and attachment_record: a missing or empty field is None,
+the first of repeated fields wins and forgotten tells whether a
+forgottenDateTime field is present.
+"""
+
+from xml.etree.ElementTree import ParseError
+from xml.parsers.expat import ExpatError, ParserCreate
+
+from .brain2neo import AttachmentRecord, LinkRecord, ThoughtRecord
+
+
+# bytes read from the file per Parse call
+CHUNK_SIZE = 1 << 16
+
+# record types with keys element tags and their fields with keys tags
+RECORDS = {
+    'Thought': (ThoughtRecord, {
+        'guid': 'guid',
+        'name': 'name',
+        'isType': 'is_type',
+        'forgottenDateTime': 'forgotten',
+        'accessControlType': 'access_control_type',
+        'realModificationDateTime': 'modified',
+        'creationDateTime': 'created',
+        'activationDateTime': 'activated'}),
+    'Link': (LinkRecord, {
+        'guid': 'guid',
+        'idA': 'ida',
+        'idB': 'idb',
+        'dir': 'dir',
+        'isBackward': 'is_backward',
+        'strength': 'strength',
+        'name': 'name',
+        'isType': 'is_type',
+        'linkTypeID': 'link_type_id',
+        'modificationDateTime': 'modified',
+        'creationDateTime': 'created'}),
+    'Attachment': (AttachmentRecord, {
+        'objectID': 'object_id',
+        'attachmentType': 'attachment_type',
+        'location': 'location'}),
+}
+
+# fields of the Source element
+SOURCE_FIELDS = {'guid': 'guid'}
+
+# depth of elements below BrainData sections (Thoughts/Thought) and of
+# their fields
+ELEMENT_DEPTH = 3
+FIELD_DEPTH = 4
+
+
+class RecordHandler(object):
+    """
+    Expat handlers collecting (tag, record) pairs of a document. Text is
+    only handled inside fields that are read, by setting the character
+    data handler of parser to the append method of their text parts.
+    """
+
+    def __init__(self, parser, with_attachments=True):
+        self.parser = parser
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        self.records = []
+        self.tags = RECORDS if with_attachments else \
+            {tag: r for tag, r in RECORDS.items() if tag != 'Attachment'}
+        self.depth = 0
+        self.section = None
+        # field names of the current record with keys tags, if any
+        self.fields = None
+        self.values = None
+        # current field and its text parts, if it is read
+        self.field = None
+        self.text = []
+
+    def start(self, tag, attributes):
+        self.depth += 1
+        depth = self.depth
+        if depth == FIELD_DEPTH:
+            if self.fields is not None:
+                field = self.fields.get(tag)
+                if field is not None and field not in self.values:
+                    self.read(field)
+        elif depth == ELEMENT_DEPTH:
+            if tag in self.tags:
+                self.fields = self.tags[tag][1]
+                self.values = {}
+            elif self.section == 'Source' and tag in SOURCE_FIELDS:
+                self.read(SOURCE_FIELDS[tag])
+        elif depth == ELEMENT_DEPTH - 1:
+            self.section = tag
+
+    def end(self, tag):
+        depth = self.depth
+        self.depth -= 1
+        if depth == FIELD_DEPTH:
+            field = self.field
+            if field is not None:
+                self.values[field] = self.close()
+        elif depth == ELEMENT_DEPTH:
+            if self.fields is not None:
+                self.records.append((tag, self.record(tag)))
+                self.fields = None
+            elif self.field is not None:
+                self.records.append(('Source', self.close()))
+
+    def read(self, field):
+        self.field = field
+        self.text = []
+        self.parser.CharacterDataHandler = self.text.append
+
+    def close(self):
+        """ Stop reading the current field and return its text. """
+        self.parser.CharacterDataHandler = None
+        self.field = None
+        return ''.join(self.text) or None
+
+    def record(self, tag):
+        record_type = self.tags[tag][0]
+        values = self.values
+        if tag == 'Thought':
+            values['forgotten'] = 'forgotten' in values
+        return record_type(*[values.get(f) for f in record_type._fields])
+
+    def drain(self):
+        records = self.records
+        self.records = []
+        return records
+
+
+def expat_records(source, with_attachments=True):
+    """
+    Yield the same (tag, record) pairs as element_records, source being a
+    file name or a binary file object.
+    """
+    parser = ParserCreate()
+    parser.buffer_text = True
+    handler = RecordHandler(parser, with_attachments)
+
+    f = source if hasattr(source, 'read') else open(source, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            parser.Parse(chunk, False)
+            yield from handler.drain()
+        parser.Parse(b'', True)
+        yield from handler.drain()
+    except ExpatError as e:
+        raise ParseError(str(e)) from e
+    finally:
+        if f is not source:
+            f.close()
@@ -0,0 +1,249 @@
+"""brain2neo.generate: synthetic Brain XML files of any size.
+
+Generated files follow the structure of XML exported from The Brain
+(see test/example.xml), so they can be converted like real exports. They
+are written element by element and can hold millions of thoughts.
+
+    $ python -m brain2neo.generate -o big.xml --thoughts 1000000 \
+        --links 2000000
+"""
+
+import random
+import argparse
+
+from xml.sax.saxutils import escape
+
+
+THOUGHT = ("""        <Thought>
+            <guid>{guid}</guid>
+            <name>{name}</name>
+            <label>{label}</label>
+            <creationDateTime>{created}</creationDateTime>
+            <realModificationDateTime>{modified}</realModificationDateTime>
+            <displayModificationDateTime>{modified}"""
+           """</displayModificationDateTime>
+{forgotten}            <activationDateTime>{modified}</activationDateTime>
+            <linksModificationDateTime>{modified}</linksModificationDateTime>
+            <isType>{is_type}</isType>
+            <color>ff666600</color>
+            <accessControlType>{access}</accessControlType>
+        </Thought>
+""")
+
+FORGOTTEN = """            <forgottenDateTime>{modified}</forgottenDateTime>
+"""
+
+LINK = """        <Link>
+            <guid>{guid}</guid>
+{ends}            <dir>{dir}</dir>
+            <isBackward>{backward}</isBackward>
+            <name>{name}</name>
+            <labelForward></labelForward>
+            <labelBackward></labelBackward>
+            <creationDateTime>{created}</creationDateTime>
+            <modificationDateTime>{modified}</modificationDateTime>
+            <isType>{is_type}</isType>
+            <color>0</color>
+            <thickness>0</thickness>
+            <strength>{strength}</strength>
+            <meaning>{meaning}</meaning>
+            <linkTypeID>{link_type}</linkTypeID>
+        </Link>
+"""
+
+ENDS = """            <idA>{ida}</idA>
+            <idB>{idb}</idB>
+"""
+
+ATTACHMENT = """        <Attachment>
+            <guid>{guid}</guid>
+            <AttachmentEntries>
+                <attachmentEntryID>{entry}</attachmentEntryID>
+            </AttachmentEntries>
+            <objectID>{object_id}</objectID>
+            <name>{name}</name>
+            <attachmentType>{attachment_type}</attachmentType>
+            <location>{location}</location>
+            <dataLength>0</dataLength>
+            <format></format>
+            <creationDateTime>{created}</creationDateTime>
+            <modificationDateTime>{modified}</modificationDateTime>
+        </Attachment>
+"""
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE BrainData SYSTEM "http://www.thebrain.com/dtd/BrainData1.dtd">
+<BrainData>
+    <Source>
+        <guid>{guid}</guid>
+        <name>Generated</name>
+        <personalBrainVersion>8021</personalBrainVersion>
+        <telepathyVersion>10</telepathyVersion>
+        <fileRoot></fileRoot>
+        <generatedDateTime>{created}</generatedDateTime>
+        <homeThoughtGuid>{home}</homeThoughtGuid>
+        <modificationDateTime>{created}</modificationDateTime>
+    </Source>
+    <Attributes/>
+"""
+
+FOOTER = """    <AttributeDatas/>
+    <Entries/>
+"""
+
+
+class Generator(object):
+    """ Random source of guids, timestamps and names. """
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+
+    def guid(self):
+        bits = self.random.getrandbits(128)
+        h = '{:032X}'.format(bits)
+        return '{}-{}-{}-{}-{}'.format(h[:8], h[8:12], h[12:16], h[16:20],
+                                       h[20:])
+
+    def timestamp(self):
+        r = self.random
+        return '20{:02d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}.{:03d} @-0{}00' \
+            .format(r.randint(10, 16), r.randint(1, 12), r.randint(1, 28),
+                    r.randint(0, 23), r.randint(0, 59), r.randint(0, 59),
+                    r.randint(0, 999), r.choice('45'))
+
+    def name(self, prefix, n):
+        # some names need unescaping like real exports, which escape
+        # text before writing it as XML
+        if self.random.random() < 0.05:
+            return escape(escape('{} & {} #{}'.format(prefix, prefix.lower(),
+                                                     n)))
+        return '{} {}'.format(prefix, n)
+
+
+def thought_xml(gen, guid, name, is_type, forgotten, private):
+    created = gen.timestamp()
+    modified = gen.timestamp()
+    return THOUGHT.format(
+        guid=guid, name=name, label=name if is_type else '',
+        created=created, modified=modified,
+        forgotten=FORGOTTEN.format(modified=modified) if forgotten else '',
+        is_type='1' if is_type else '0', access='1' if private else '0')
+
+
+def link_xml(gen, guid, ida=None, idb=None, direction='1', backward='0',
+             name='', is_type='0', strength='0', meaning='1', link_type=''):
+    ends = ENDS.format(ida=ida, idb=idb) if ida is not None else ''
+    return LINK.format(
+        guid=guid, ends=ends, dir=direction, backward=backward, name=name,
+        created=gen.timestamp(), modified=gen.timestamp(), is_type=is_type,
+        strength=strength, meaning=meaning, link_type=link_type)
+
+
+def generate_brain(f, thoughts=1000, types=10, links=2000, link_types=5,
+                   named_links=0.05, typed=0.5, attachments=200,
+                   forgotten=0.01, private=0.05, seed=0):
+    """
+    Write a Brain XML document to the text file f.
+
+    thoughts, types, links, link_types and attachments are element counts,
+    named_links, typed (thoughts with a type), forgotten and private are
+    ratios in [0, 1].
+    """
+    gen = Generator(seed)
+    r = gen.random
+
+    thought_guids = [gen.guid() for _ in range(thoughts)]
+    type_guids = [gen.guid() for _ in range(types)]
+    link_type_guids = [gen.guid() for _ in range(link_types)]
+
+    f.write(HEADER.format(guid=gen.guid(), created=gen.timestamp(),
+                          home=thought_guids[0] if thoughts else ''))
+
+    f.write('    <Thoughts>\n')
+    for n, guid in enumerate(type_guids):
+        f.write(thought_xml(gen, guid, 'Type {}'.format(n), True, False,
+                            False))
+    for n, guid in enumerate(thought_guids):
+        f.write(thought_xml(gen, guid, gen.name('Thought', n), False,
+                            r.random() < forgotten, r.random() < private))
+    f.write('    </Thoughts>\n')
+
+    f.write('    <Links>\n')
+    for n, guid in enumerate(link_type_guids):
+        f.write(link_xml(gen, guid, direction='0', name='type {}'.format(n),
+                         is_type='1', meaning='0'))
+    if types:
+        for guid in thought_guids:
+            if r.random() < typed:
+                f.write(link_xml(gen, gen.guid(), r.choice(type_guids), guid,
+                                 direction='2', meaning='2'))
+    if thoughts:
+        for n in range(links):
+            direction = r.choice('1123')
+            link_type = ''
+            name = ''
+            p = r.random()
+            if p < named_links:
+                name = gen.name('link', n % 50)
+            elif link_types and p < 2 * named_links:
+                link_type = r.choice(link_type_guids)
+            f.write(link_xml(
+                gen, gen.guid(), r.choice(thought_guids),
+                r.choice(thought_guids), direction=direction,
+                backward=r.choice('01') if direction == '3' else '0',
+                name=name, strength=r.choice('0023'), link_type=link_type))
+    f.write('    </Links>\n')
+
+    f.write(FOOTER)
+
+    f.write('    <Attachments>\n')
+    if thoughts:
+        for n in range(attachments):
+            is_url = r.random() < 0.7
+            location = 'https://example.com/{}'.format(n) if is_url \
+                else 'C:\\brain\\files\\{}.txt'.format(n)
+            f.write(ATTACHMENT.format(
+                guid=gen.guid(), entry=gen.guid(),
+                object_id=r.choice(thought_guids),
+                name='Attachment {}'.format(n),
+                attachment_type='3' if is_url else '2', location=location,
+                created=gen.timestamp(), modified=gen.timestamp()))
+    f.write('    </Attachments>\n')
+    f.write('</BrainData>\n')
+
+
+def write_brain(path, **options):
+    """ Write a generated Brain XML file to path (see generate_brain). """
+    with open(path, 'w', encoding='utf-8') as f:
+        generate_brain(f, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic Brain XML file')
+    parser.add_argument('-o', '--output', required=True,
+                        help='XML file to be written')
+    parser.add_argument('--thoughts', type=int, default=1000)
+    parser.add_argument('--types', type=int, default=10)
+    parser.add_argument('--links', type=int, default=2000)
+    parser.add_argument('--link-types', type=int, default=5)
+    parser.add_argument('--attachments', type=int, default=200)
+    parser.add_argument('--typed', type=float, default=0.5,
+                        help='ratio of thoughts with a type')
+    parser.add_argument('--forgotten', type=float, default=0.01,
+                        help='ratio of forgotten thoughts')
+    parser.add_argument('--private', type=float, default=0.05,
+                        help='ratio of private thoughts')
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+
+    write_brain(args.output, thoughts=args.thoughts, types=args.types,
+                links=args.links, link_types=args.link_types,
+                attachments=args.attachments, typed=args.typed,
+                forgotten=args.forgotten, private=args.private,
+                seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""brain2neo.incremental: update a database filled by a previous run.
+
+Thoughts and links are matched by the guid property stored with them.
+Entities whose modification time, labels, type or endpoints are
+unchanged are not written at all, so the cost of a refresh follows the
+size of the change instead of the size of the brain. Only ids, guids,
+modification times and labels or types are read, in pages ordered by
+id; properties are read only for the thoughts without a modification
+time, which cannot be compared otherwise.
+
+Upserts are routed using the guids read from the database: stored
+entities are matched by their database id and updated in place, new
+ones are created. This avoids a MERGE lookup per row, which without a
+guid index would scan every node.
+
+With source_namespace, only the entities of the brain's Source are read
+(and deleted when no longer converted), so that brains sharing a
+database are updated independently.
+"""
+
+import logging as log
+
+from .brain2neo import (NODE_TIMESTAMPS, BatchSizer, cypher_name,
+                        create_entities, create_nodes, create_relationships,
+                        create_schema, datetime_clause, get_pool)
+
+
+logger = log.getLogger('brain2neo')
+
+
+# stored entities read per statement
+READ_PAGE = 10000
+
+STORED_NODES = ('MATCH (n{}) WHERE id(n) > $after AND n.guid IS NOT NULL{} '
+                'RETURN id(n) AS id, n.guid AS guid, '
+                'n.modified AS modified, labels(n) AS labels '
+                'ORDER BY id LIMIT $limit')
+
+STORED_RELATIONSHIPS = ('MATCH (a{})-[r]->(b) '
+                        'WHERE id(r) > $after AND r.guid IS NOT NULL{} '
+                        'RETURN id(r) AS id, r.guid AS guid, '
+                        'r.modified AS modified, type(r) AS type, '
+                        'a.guid AS a, b.guid AS b '
+                        'ORDER BY id LIMIT $limit')
+
+STORED_PROPERTIES = ('UNWIND $rows AS id MATCH (n) WHERE id(n) = id '
+                     'RETURN id(n) AS id, properties(n) AS props')
+
+UPDATE_NODES = ('UNWIND $rows AS row '
+                'MATCH (n) WHERE id(n) = row.id SET n = row.props')
+
+DELETE_NODES = ('UNWIND $rows AS id '
+                'MATCH (n) WHERE id(n) = id DETACH DELETE n')
+
+DELETE_RELATIONSHIPS = ('UNWIND $rows AS id '
+                        'MATCH ()-[r]->() WHERE id(r) = id DELETE r')
+
+
+def add_label_statement(label):
+    return ('UNWIND $rows AS id MATCH (n) WHERE id(n) = id SET n:{}'
+            .format(cypher_name(label)))
+
+
+def remove_label_statement(label):
+    return ('UNWIND $rows AS id MATCH (n) WHERE id(n) = id REMOVE n:{}'
+            .format(cypher_name(label)))
+
+
+def namespace(brain, name):
+    """
+    Label and condition restricting node name to the nodes of brain's
+    Source, empty if brains are not told apart.
+    """
+    if brain.source_label is not None:
+        return ':' + cypher_name(brain.source_label), ''
+    elif brain.source is not None:
+        return '', ' AND {}.source = $source'.format(name)
+    return '', ''
+
+
+def read_pages(graph, statement, **parameters):
+    """
+    Dictionary of the records of statement with keys guid values, read
+    READ_PAGE at a time after the id of the last record read.
+    """
+    records = {}
+    after = -1
+    while True:
+        page = graph.run(statement, after=after, limit=READ_PAGE,
+                         **parameters).data()
+        for record in page:
+            records[record['guid']] = record
+        if len(page) < READ_PAGE:
+            return records
+        after = page[-1]['id']
+
+
+def stored_nodes(graph, brain):
+    """ Dictionary of stored nodes of brain with keys guid values. """
+    statement = STORED_NODES.format(*namespace(brain, 'n'))
+    return read_pages(graph, statement, source=brain.source)
+
+
+def stored_relationships(graph, brain):
+    """
+    Dictionary of stored relationships of brain with keys guid values.
+    """
+    statement = STORED_RELATIONSHIPS.format(*namespace(brain, 'a'))
+    return read_pages(graph, statement, source=brain.source)
+
+
+def stored_properties(graph, ids):
+    """ Properties of the nodes ids, with keys the ids. """
+    properties = {}
+    for start in range(0, len(ids), READ_PAGE):
+        for record in graph.run(STORED_PROPERTIES,
+                                rows=ids[start:start + READ_PAGE]).data():
+            properties[record['id']] = record['props']
+    return properties
+
+
+def update_nodes_statement(timestamps=False):
+    return UPDATE_NODES + datetime_clause('n',
+                                          timestamps and NODE_TIMESTAMPS)
+
+
+def is_node_changed(brain, i, stored):
+    return stored['modified'] != brain.node_modified[i] \
+        or set(stored['labels']) != brain.node_labels[i]
+
+
+def are_properties_changed(brain, i, stored_props):
+    # null properties are never stored, temporal values come back
+    # converted and their changes show in modified anyway
+    ignored = NODE_TIMESTAMPS if brain.timestamps else ()
+    props = {k: v for k, v in brain.node_properties(i).items()
+             if v is not None and k not in ignored}
+    return props != {k: v for k, v in stored_props.items()
+                     if v is not None and k not in ignored}
+
+
+def is_relationship_changed(brain, j, stored):
+    guids = brain.node_guids
+    return stored['modified'] != brain.rel_modified[j] \
+        or stored['type'] != brain.rel_types[j] \
+        or stored['a'] != guids[brain.rel_starts[j]] \
+        or stored['b'] != guids[brain.rel_ends[j]]
+
+
+def update_labels(graph, changes, statement, sizer):
+    """ Apply label changes, a dictionary of id lists with keys labels. """
+    for label, ids in changes.items():
+        create_entities(graph, statement(label), ids, sizer)
+
+
+def update_nodes(graph, brain, indices, stored, sizer):
+    """ Overwrite properties and labels of stored nodes. """
+    rows = []
+    added = {}
+    removed = {}
+    for i in indices:
+        record = stored[brain.node_guids[i]]
+        rows.append({'id': record['id'], 'props': brain.node_properties(i)})
+
+        labels = brain.node_labels[i]
+        old_labels = set(record['labels'])
+        for label in labels - old_labels:
+            added.setdefault(label, []).append(record['id'])
+        for label in old_labels - labels:
+            removed.setdefault(label, []).append(record['id'])
+
+    create_entities(graph, update_nodes_statement(brain.timestamps), rows,
+                    sizer)
+    update_labels(graph, removed, remove_label_statement, sizer)
+    update_labels(graph, added, add_label_statement, sizer)
+
+
+def update_entities(graph, brain, cfg, rejects=None):
+    """ Bring the entities stored by a previous run in line with brain. """
+    sizer = BatchSizer(cfg, rejects)
+
+    logger.info('Reading stored entities.')
+    old_nodes = stored_nodes(graph, brain)
+    old_relationships = stored_relationships(graph, brain)
+
+    node_ids = [None] * brain.node_count()
+    new_nodes = []
+    changed_nodes = []
+    # nodes without modification time, compared by their properties
+    undated_nodes = []
+    for i, guid in enumerate(brain.node_guids):
+        stored = old_nodes.get(guid)
+        if stored is None:
+            new_nodes.append(i)
+            continue
+
+        node_ids[i] = stored['id']
+        if is_node_changed(brain, i, stored):
+            changed_nodes.append(i)
+        elif brain.node_modified[i] is None:
+            undated_nodes.append(i)
+
+    if undated_nodes:
+        stored_props = stored_properties(
+            graph, [node_ids[i] for i in undated_nodes])
+        changed_nodes.extend(
+            i for i in undated_nodes
+            if are_properties_changed(brain, i, stored_props[node_ids[i]]))
+
+    new_relationships = []
+    # changed relationships are deleted and created again, since their
+    # type or endpoints cannot be updated in place
+    deleted_relationships = []
+    for j, guid in enumerate(brain.rel_guids):
+        stored = old_relationships.get(guid)
+        if stored is None:
+            new_relationships.append(j)
+        elif is_relationship_changed(brain, j, stored):
+            deleted_relationships.append(stored['id'])
+            new_relationships.append(j)
+
+    rel_guids = set(brain.rel_guids)
+    deleted_relationships.extend(
+        stored['id'] for guid, stored in old_relationships.items()
+        if guid not in rel_guids)
+    deleted_nodes = [stored['id'] for guid, stored in old_nodes.items()
+                     if guid not in brain.node_index]
+
+    logger.info('Nodes: {} new, {} changed, {} deleted, {} unchanged.'
+                .format(len(new_nodes), len(changed_nodes),
+                        len(deleted_nodes), brain.node_count()
+                        - len(new_nodes) - len(changed_nodes)))
+    logger.info('Relationships: {} created, {} deleted.'
+                .format(len(new_relationships), len(deleted_relationships)))
+
+    create_entities(graph, DELETE_RELATIONSHIPS, deleted_relationships,
+                    sizer)
+    create_entities(graph, DELETE_NODES, deleted_nodes, sizer)
+    update_nodes(graph, brain, changed_nodes, old_nodes, sizer)
+    create_nodes(graph, brain, new_nodes, node_ids, sizer)
+    create_schema(graph, brain, cfg)
+    create_relationships(graph, brain, new_relationships, node_ids, sizer,
+                         get_pool(graph, cfg))
@@ -0,0 +1,286 @@
+"""brain2neo.index: columnar graph index for queries without Neo4j.
+
+A converted Brain is turned into NumPy arrays: relationships in
+compressed sparse row (CSR) form in both directions, relationship types
+as integer codes and labels as bitmaps of node membership. Questions
+such as how many thoughts are songs, or which singers have the most
+songs, are then answered with vectorized operations
+
+    >>> index = GraphIndex.from_brain(brain)
+    >>> index.count('Song')
+    >>> index.top('Singer', 'SINGS', n=10)
+
+An index is saved as a directory of .npy files, which load memory
+mapped, so opening the index of a large brain reads almost nothing
+
+    $ brain2neo -f <path_to_xml> --output-index <dir>
+    $ python -m brain2neo.index <dir> --labels
+    $ python -m brain2neo.index <dir> --top Singer --type SINGS
+
+NumPy is an optional dependency (pip install brain2neo[index]).
+"""
+
+import os
+import json
+import argparse
+import logging as log
+
+import numpy as np
+
+
+logger = log.getLogger('brain2neo')
+
+META_FILE = 'index.json'
+
+# arrays of an index, each saved as <name>.npy
+ARRAYS = ('guids', 'name_offsets', 'name_bytes', 'label_bitmaps',
+          'out_offsets', 'out_targets', 'out_codes',
+          'in_offsets', 'in_sources', 'in_codes')
+
+DIRECTIONS = ('out', 'in', 'both')
+
+# number of set bits of every byte value
+POPCOUNT = np.array([bin(b).count('1') for b in range(256)], dtype=np.int64)
+
+
+def csr(keys, values, codes, n):
+    """
+    Offsets, values and codes sorted by keys, so that the entries of key
+    i are [offsets[i], offsets[i + 1]).
+    """
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return offsets, values[order], codes[order]
+
+
+def encode_strings(strings):
+    """ Offsets and UTF-8 bytes of concatenated strings. """
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def gather(offsets, values, nodes):
+    """ Positions in values of the entries of all nodes. """
+    starts = offsets[nodes]
+    lengths = offsets[nodes + 1] - starts
+    total = int(lengths.sum())
+    # position within each node's range, shifted to its start
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return shifts + np.arange(total)
+
+
+class GraphIndex(object):
+    """
+    Nodes are numbered like in the Brain they come from. labels and
+    rel_types are lists of names, label_bitmaps has one packed row of
+    bits per label and out_codes and in_codes hold indices of rel_types.
+    """
+
+    def __init__(self, labels, rel_types, arrays):
+        self.labels = labels
+        self.rel_types = rel_types
+        self.label_codes = {label: k for k, label in enumerate(labels)}
+        self.type_codes = {t: c for c, t in enumerate(rel_types)}
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_brain(cls, brain):
+        n = brain.node_count()
+
+        guids = np.array([g.encode('utf-8') for g in brain.node_guids],
+                         dtype=bytes)
+        name_offsets, name_bytes = encode_strings(brain.node_names)
+
+        # label sets are interned, so membership is decided per set
+        set_codes = {}
+        node_sets = np.fromiter(
+            (set_codes.setdefault(id(s), len(set_codes))
+             for s in brain.node_labels), dtype=np.int64, count=n)
+        label_sets = {id(s): s for s in brain.node_labels}
+        labels = sorted(set().union(*label_sets.values()))
+        label_bitmaps = np.zeros((len(labels), (n + 7) // 8),
+                                 dtype=np.uint8)
+        for k, label in enumerate(labels):
+            member_sets = [code for key, code in set_codes.items()
+                           if label in label_sets[key]]
+            label_bitmaps[k] = np.packbits(np.isin(node_sets, member_sets))
+
+        type_codes = {}
+        codes = np.fromiter(
+            (type_codes.setdefault(t, len(type_codes))
+             for t in brain.rel_types),
+            dtype=np.int32, count=brain.relationship_count())
+        starts = np.asarray(brain.rel_starts, dtype=np.int64)
+        ends = np.asarray(brain.rel_ends, dtype=np.int64)
+
+        arrays = {'guids': guids, 'name_offsets': name_offsets,
+                  'name_bytes': name_bytes, 'label_bitmaps': label_bitmaps}
+        (arrays['out_offsets'], arrays['out_targets'],
+         arrays['out_codes']) = csr(starts, ends, codes, n)
+        (arrays['in_offsets'], arrays['in_sources'],
+         arrays['in_codes']) = csr(ends, starts, codes, n)
+
+        return cls(labels, list(type_codes), arrays)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'),
+                                mmap_mode=mmap_mode)
+                  for name in ARRAYS}
+        return cls(meta['labels'], meta['rel_types'], arrays)
+
+    def save(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'),
+                    getattr(self, name))
+        with open(os.path.join(directory, META_FILE), 'w') as f:
+            json.dump({'labels': self.labels, 'rel_types': self.rel_types,
+                       'nodes': self.node_count(),
+                       'relationships': self.relationship_count()}, f)
+        logger.info('Index of {} nodes and {} relationships saved in {}.'
+                    .format(self.node_count(), self.relationship_count(),
+                            directory))
+
+    def node_count(self):
+        return len(self.guids)
+
+    def relationship_count(self):
+        return len(self.out_targets)
+
+    def name(self, i):
+        return bytes(self.name_bytes[self.name_offsets[i]:
+                                     self.name_offsets[i + 1]]).decode('utf-8')
+
+    def node(self, guid):
+        """ Index of the node with guid, None if there is none. """
+        found = np.flatnonzero(self.guids == guid.encode('utf-8'))
+        return int(found[0]) if len(found) else None
+
+    def has_label(self, label):
+        """ Boolean mask of nodes with label. """
+        k = self.label_codes.get(label)
+        if k is None:
+            return np.zeros(self.node_count(), dtype=bool)
+        return np.unpackbits(self.label_bitmaps[k],
+                             count=self.node_count()).astype(bool)
+
+    def nodes(self, label):
+        return np.flatnonzero(self.has_label(label))
+
+    def count(self, label):
+        k = self.label_codes.get(label)
+        if k is None:
+            return 0
+        return int(POPCOUNT[self.label_bitmaps[k]].sum())
+
+    def label_counts(self):
+        """ Number of nodes with keys labels. """
+        counts = [POPCOUNT[bitmap].sum() for bitmap in self.label_bitmaps]
+        return dict(zip(self.labels, map(int, counts)))
+
+    def type_counts(self):
+        """ Number of relationships with keys types. """
+        counts = np.bincount(self.out_codes, minlength=len(self.rel_types))
+        return dict(zip(self.rel_types, counts.tolist()))
+
+    def adjacency(self, direction):
+        if direction == 'out':
+            return [(self.out_offsets, self.out_targets, self.out_codes)]
+        elif direction == 'in':
+            return [(self.in_offsets, self.in_sources, self.in_codes)]
+        elif direction == 'both':
+            return self.adjacency('out') + self.adjacency('in')
+        raise ValueError('Direction must be one of {}: {}'
+                         .format(', '.join(DIRECTIONS), direction))
+
+    def degree(self, rel_type=None, direction='out'):
+        """ Number of relationships of every node, of rel_type if given. """
+        degree = np.zeros(self.node_count(), dtype=np.int64)
+        for offsets, _, codes in self.adjacency(direction):
+            if rel_type is None:
+                degree += np.diff(offsets)
+                continue
+            # count of matching entries up to every offset
+            matches = np.zeros(len(codes) + 1, dtype=np.int64)
+            np.cumsum(codes == self.type_codes.get(rel_type, -1),
+                      out=matches[1:])
+            degree += matches[offsets[1:]] - matches[offsets[:-1]]
+        return degree
+
+    def top(self, label, rel_type=None, direction='out', n=10):
+        """
+        (name, degree) of the n nodes with label and the most
+        relationships of rel_type, most first.
+        """
+        nodes = self.nodes(label)
+        degree = self.degree(rel_type, direction)[nodes]
+        order = np.argsort(-degree, kind='stable')[:n]
+        return [(self.name(i), int(d))
+                for i, d in zip(nodes[order], degree[order])]
+
+    def neighborhood(self, nodes, k=1, rel_type=None, direction='both'):
+        """
+        Sorted indices of nodes within k hops of nodes (an index or a
+        sequence of indices), following relationships of rel_type if given.
+        """
+        code = None if rel_type is None else self.type_codes.get(rel_type, -1)
+        seen = np.zeros(self.node_count(), dtype=bool)
+        frontier = np.unique(np.atleast_1d(np.asarray(nodes, dtype=np.int64)))
+        seen[frontier] = True
+
+        for _ in range(k):
+            reached = []
+            for offsets, values, codes in self.adjacency(direction):
+                positions = gather(offsets, values, frontier)
+                if code is not None:
+                    positions = positions[codes[positions] == code]
+                reached.append(values[positions])
+            frontier = np.unique(np.concatenate(reached))
+            frontier = frontier[~seen[frontier]]
+            if not len(frontier):
+                break
+            seen[frontier] = True
+
+        return np.flatnonzero(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Query an index written with --output-index')
+    parser.add_argument('index_dir')
+    parser.add_argument('--labels', action='store_true',
+                        help='number of nodes of every label')
+    parser.add_argument('--types', action='store_true',
+                        help='number of relationships of every type')
+    parser.add_argument('--top', metavar='LABEL',
+                        help='nodes of LABEL with the most relationships')
+    parser.add_argument('--type', help='relationship type counted by --top')
+    parser.add_argument('--direction', choices=DIRECTIONS, default='out')
+    parser.add_argument('-n', type=int, default=10)
+
+    args = parser.parse_args()
+
+    index = GraphIndex.load(args.index_dir)
+    if args.labels:
+        for label, count in sorted(index.label_counts().items()):
+            print('{}\t{}'.format(label, count))
+    if args.types:
+        for rel_type, count in sorted(index.type_counts().items()):
+            print('{}\t{}'.format(rel_type, count))
+    if args.top is not None:
+        for name, degree in index.top(args.top, args.type, args.direction,
+                                      args.n):
+            print('{}\t{}'.format(name, degree))
+
+
+if __name__ == '__main__':
+    main()
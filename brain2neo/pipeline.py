@@ -0,0 +1,258 @@
+"""brain2neo.pipeline: write a brain while it is being parsed.
+
+The XML file is converted on the calling thread and batches are handed
+to a writer thread through a bounded queue, so that parsing and database
+round trips overlap and at most queue_size batches are held in flight.
+
+Nodes are sent as soon as batch_size of them are converted, with the
+labels and properties known at that point. Relationships are sent by
+type, after all nodes converted before them, and the writer commits
+batches in order, so their endpoints are always in the database. What
+is learned about nodes later (type labels from links and attachment
+properties) is applied at the end with SET statements. The conversion
+stops as soon as the writer failed.
+"""
+
+import time
+import queue
+import threading
+import logging as log
+
+from .brain2neo import (NODE_TIMESTAMPS, BatchSizer, LinkConverter,
+                        add_attachment, add_thought, create_entities,
+                        create_labeled, create_partitioned, create_schema,
+                        create_typed, datetime_clause, element_records,
+                        get_pool, get_rejects, ignore_attachments,
+                        is_expat_parser, is_sharded_parser, log_rate,
+                        namespace_brain, new_brain, node_rows, open_xml,
+                        prepare_graph, relationship_rows)
+from .incremental import add_label_statement
+from .stats import timed
+
+
+logger = log.getLogger('brain2neo')
+
+
+SET_PROPERTIES = ('UNWIND $rows AS row '
+                  'MATCH (n) WHERE id(n) = row.id SET n += row.props')
+
+
+def set_properties_statement(timestamps=False):
+    return SET_PROPERTIES + datetime_clause('n',
+                                            timestamps and NODE_TIMESTAMPS)
+
+
+def read_records(f, cfg):
+    """ Records of the binary file f read by the configured parser. """
+    with_attachments = not ignore_attachments(cfg)
+    parser = cfg['Parse']['parser']
+    # a pipeline reads the file in order, sharded reads it like expat
+    if is_expat_parser(parser) or is_sharded_parser(parser):
+        from .fastparse import expat_records
+        return expat_records(f, with_attachments)
+
+    # the tree parser streams as well, a tree cannot be pipelined
+    return element_records(f, with_attachments)
+
+
+class Writer(threading.Thread):
+    """
+    Commits batches taken from a queue in order, until it gets None.
+    After an error the remaining batches are dropped, so that the
+    producer is never blocked, and the error is kept in error for the
+    producer to stop at.
+    """
+
+    def __init__(self, graph, brain, cfg, batches, rejects=None):
+        threading.Thread.__init__(self, name='brain2neo-writer',
+                                  daemon=True)
+        self.graph = graph
+        self.brain = brain
+        self.cfg = cfg
+        self.batches = batches
+        self.sizer = BatchSizer(cfg, rejects)
+        self.pool = get_pool(graph, cfg)
+        # database ids with keys node indices
+        self.node_ids = {}
+        self.error = None
+
+    def run(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            if self.error is None:
+                try:
+                    self.write(*batch)
+                except BaseException as e:
+                    self.error = e
+
+    def write(self, kind, data):
+        graph = self.graph
+        if kind == 'nodes':
+            create_labeled(graph, data, self.node_ids, self.sizer,
+                           timestamps=self.brain.timestamps)
+        elif kind == 'relationships':
+            groups = relationship_rows(self.brain, data, self.node_ids,
+                                       self.sizer.rejects)
+            timestamps = self.brain.timestamps
+            if self.pool.size > 1:
+                create_partitioned(self.pool, groups, self.sizer,
+                                   timestamps=timestamps)
+            else:
+                create_typed(graph, groups, self.sizer,
+                             timestamps=timestamps)
+        elif kind == 'labels':
+            # rejected nodes have no database id
+            node_ids = self.node_ids
+            for label, indices in data.items():
+                create_entities(graph, add_label_statement(label),
+                                [node_ids[i] for i in indices
+                                 if i in node_ids],
+                                self.sizer)
+        elif kind == 'properties':
+            rows = [{'id': self.node_ids[i], 'props': props}
+                    for i, props in data if i in self.node_ids]
+            create_entities(graph,
+                            set_properties_statement(self.brain.timestamps),
+                            rows, self.sizer)
+        elif kind == 'schema':
+            create_schema(graph, self.brain, self.cfg)
+
+
+class Emitter(object):
+    """
+    Sends converted entities of brain to the writer in batches. Nodes
+    are sent in order of conversion, relationships are collected by type
+    and a type is sent once batch_size relationships of it are waiting,
+    since each type needs a statement of its own. Once writer failed,
+    sending raises its error, which stops the conversion.
+    """
+
+    def __init__(self, brain, batches, batch_size, writer=None):
+        self.brain = brain
+        self.batches = batches
+        self.batch_size = batch_size
+        self.writer = writer
+        self.nodes_sent = 0
+        # label sets of sent nodes, as they were sent
+        self.sent_labels = []
+        self.relationships_seen = 0
+        # indices of waiting relationships with keys types
+        self.waiting = {}
+
+    def put(self, kind, data):
+        if self.writer is not None and self.writer.error is not None:
+            raise self.writer.error
+        self.batches.put((kind, data))
+
+    def nodes(self, force=False):
+        n = self.brain.node_count()
+        if n - self.nodes_sent >= self.batch_size \
+                or force and n > self.nodes_sent:
+            indices = range(self.nodes_sent, n)
+            self.sent_labels.extend(self.brain.node_labels[i]
+                                    for i in indices)
+            self.put('nodes', node_rows(self.brain, indices))
+            self.nodes_sent = n
+
+    def relationships(self, force=False):
+        rel_types = self.brain.rel_types
+        n = self.brain.relationship_count()
+        for j in range(self.relationships_seen, n):
+            indices = self.waiting.setdefault(rel_types[j], [])
+            indices.append(j)
+            if len(indices) >= self.batch_size:
+                self.send(rel_types[j])
+        self.relationships_seen = n
+
+        if force:
+            for rel_type in list(self.waiting):
+                self.send(rel_type)
+
+    def send(self, rel_type):
+        # endpoints must be sent first
+        self.nodes(force=True)
+        self.put('relationships', self.waiting.pop(rel_type))
+
+    def updates(self):
+        """ Send labels and properties nodes got after they were sent. """
+        brain = self.brain
+        labels = {}
+        for i, sent in enumerate(self.sent_labels):
+            for label in brain.node_labels[i] - sent:
+                labels.setdefault(label, []).append(i)
+        if labels:
+            self.put('labels', labels)
+
+        # attachments come last in Brain XML, after nodes were sent
+        properties = [(i, brain.node_properties(i))
+                      for i in sorted(brain.node_extra)
+                      if i < self.nodes_sent]
+        if properties:
+            self.put('properties', properties)
+
+
+@timed
+def convert_pipelined(records, brain, cfg, emitter):
+    """ Same as convert_records, sending batches with emitter. """
+    types = {}
+    links = LinkConverter(brain, types, cfg)
+
+    for tag, record in records:
+        if tag == 'Thought':
+            n = brain.node_count()
+            add_thought(record, brain, types, cfg)
+            # thoughts after the Source are sent with its label
+            if brain.source_label is not None:
+                for i in range(n, brain.node_count()):
+                    brain.add_label(i, brain.source_label)
+            emitter.nodes()
+        elif tag == 'Link':
+            links.add(record)
+            emitter.relationships()
+        elif tag == 'Attachment':
+            add_attachment(record, brain)
+        else:
+            # Source comes first, so a source property or label is sent
+            # with nodes, nodes sent before get the label with updates
+            namespace_brain(brain, record, cfg)
+
+    links.finish()
+    emitter.relationships(force=True)
+    emitter.nodes(force=True)
+    emitter.updates()
+
+    return brain
+
+
+def pipeline2neo(xml_file, cfg):
+    """ Same as file2neo, with parsing and writing overlapped. """
+    graph = prepare_graph(cfg)
+
+    brain = new_brain(cfg)
+    rejects = get_rejects(xml_file, brain, cfg)
+    batches = queue.Queue(cfg['Neo4j']['queue_size'])
+    writer = Writer(graph, brain, cfg, batches, rejects)
+    emitter = Emitter(brain, batches, cfg['Neo4j']['batch_size'], writer)
+
+    logger.info('Converting and writing XML {} in a pipeline.'
+                .format(xml_file))
+    start = time.time()
+    writer.start()
+    try:
+        with open_xml(xml_file) as f:
+            convert_pipelined(read_records(f, cfg), brain, cfg, emitter)
+        emitter.put('schema', None)
+    finally:
+        batches.put(None)
+        writer.join()
+        if rejects is not None:
+            rejects.close()
+
+    if writer.error is not None:
+        raise writer.error
+
+    log_rate('nodes and relationships',
+             brain.node_count() + brain.relationship_count(), start)
+    return brain
@@ -0,0 +1,163 @@
+"""brain2neo.shard: parse a Brain XML file on several processes.
+
+The contents of the Thoughts and Links sections are split into byte
+ranges that start at a <Thought> or <Link> tag, and every range is read
+by a process of a pool, wrapped in the elements that enclose it, with
+the expat handler of brain2neo.fastparse. The rest of the file, where
+Source and Attachments are, is read by one more process with the two
+sections left empty.
+
+Workers return records, which are merged in document order (Source,
+Thoughts, Links, Attachments) and converted by the calling process, so
+the brain is exactly the one expat_brain converts.
+
+Ranges are found in the raw bytes, so files must be plain (not
+compressed) UTF-8 XML in which the tags only occur as markup, which is
+the case for Brain exports. Other files are parsed sequentially.
+"""
+
+import os
+import re
+import mmap
+import logging as log
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree.ElementTree import ParseError
+from xml.parsers.expat import ExpatError, ParserCreate
+
+from .brain2neo import (convert_records, expat_brain, ignore_attachments,
+                        open_xml)
+from .fastparse import RecordHandler
+from .stats import timed
+
+
+logger = log.getLogger('brain2neo')
+
+# sections split into ranges and the tag their elements start with
+SECTIONS = ((b'Thoughts', b'<Thought>'), (b'Links', b'<Link>'))
+
+# ranges per worker, more than one evens out workers
+RANGES_PER_JOB = 4
+
+# smallest range worth sending to a worker
+MIN_RANGE_BYTES = 1 << 20
+
+ENCODING = re.compile(br'<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)')
+
+
+def is_utf8(m):
+    """ Whether the XML declaration at the start of m allows UTF-8. """
+    match = ENCODING.match(m[:200].lstrip(b'\xef\xbb\xbf'))
+    return match is None \
+        or match.group(1).lower() in (b'utf-8', b'utf8', b'us-ascii')
+
+
+def section_contents(m, name):
+    """ Byte range of the contents of section name, None if missing. """
+    start = m.find(b'<' + name + b'>')
+    if start < 0:
+        return None
+    start += len(name) + 2
+    end = m.find(b'</' + name + b'>', start)
+    if end < 0:
+        return None
+    return start, end
+
+
+def split_range(m, start, end, tag, n):
+    """ Split [start, end) of m in at most n ranges beginning with tag. """
+    cuts = [start]
+    for k in range(1, n):
+        cut = m.find(tag, max(start + k * (end - start) // n, cuts[-1] + 1),
+                     end)
+        if cut < 0:
+            break
+        if cut > cuts[-1]:
+            cuts.append(cut)
+    cuts.append(end)
+    return list(zip(cuts, cuts[1:]))
+
+
+def parse_bytes(data, with_attachments):
+    parser = ParserCreate()
+    parser.buffer_text = True
+    handler = RecordHandler(parser, with_attachments)
+    try:
+        parser.Parse(data, True)
+    except ExpatError as e:
+        raise ParseError(str(e)) from e
+    return handler.drain()
+
+
+def parse_range(xml_file, section, start, end):
+    """ Records of the elements in [start, end) of section. """
+    # runs in a worker process
+    with open(xml_file, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        data = b''.join((b'<BrainData><', section, b'>', m[start:end],
+                         b'</', section, b'></BrainData>'))
+    return parse_bytes(data, False)
+
+
+def parse_rest(xml_file, contents, with_attachments):
+    """ Records of the file without the contents of split sections. """
+    # runs in a worker process
+    with open(xml_file, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        pieces = []
+        position = 0
+        for start, end in contents:
+            pieces.append(m[position:start])
+            position = end
+        pieces.append(m[position:])
+    return parse_bytes(b''.join(pieces), with_attachments)
+
+
+def parse_jobs(cfg):
+    return cfg['Parse']['parse_jobs'] or os.cpu_count() or 1
+
+
+@timed
+def sharded_brain(xml_file, cfg):
+    """
+    Same as expat_brain, with ranges of the file parsed by a pool of
+    parse_jobs processes.
+    """
+    jobs = parse_jobs(cfg)
+    with open_xml(xml_file) as m:
+        # only plain files are mapped, daemonic processes (workers of a
+        # multiprocessing.Pool) cannot start a pool of their own, batch
+        # mode sets parse_jobs to 1 in its workers
+        if jobs == 1 or not isinstance(m, mmap.mmap) or not is_utf8(m) \
+                or multiprocessing.current_process().daemon:
+            logger.info('Parsing {} in a single process.'.format(xml_file))
+            return expat_brain(m, cfg)
+
+        ranges = []
+        contents = []
+        for section, tag in SECTIONS:
+            content = section_contents(m, section)
+            if content is None:
+                continue
+            contents.append(content)
+            n = min(jobs * RANGES_PER_JOB,
+                    max(1, (content[1] - content[0]) // MIN_RANGE_BYTES))
+            ranges.extend((section, start, end) for start, end in
+                          split_range(m, content[0], content[1], tag, n))
+
+    logger.info('Parsing {} in {} ranges with {} processes.'
+                .format(xml_file, len(ranges), jobs))
+    with ProcessPoolExecutor(jobs) as executor:
+        rest = executor.submit(parse_rest, xml_file, sorted(contents),
+                               not ignore_attachments(cfg))
+        parts = [executor.submit(parse_range, xml_file, *r) for r in ranges]
+
+        def records():
+            rest_records = rest.result()
+            yield from (r for r in rest_records if r[0] == 'Source')
+            for part in parts:
+                yield from part.result()
+            yield from (r for r in rest_records if r[0] != 'Source')
+
+        return convert_records(records(), cfg)
@@ -0,0 +1,162 @@
+"""brain2neo.spill: conversion state kept on disk beyond a threshold.
+
+The guid index of a Brain maps the guid of every converted thought to its
+node index and is looked up for both ends of every link, and links that
+wait for a late link type are kept until the end of the links. For very
+large brains these outgrow memory, so once they hold spill_threshold
+entries they are moved to a temporary sqlite database.
+
+Databases are opened with an empty file name, which sqlite creates in
+its temporary directory (TMPDIR) and deletes when they are closed.
+Entries are written in batches and recently looked up guids are kept in
+an LRU cache in front of the database, since links of a thought tend to
+come together.
+"""
+
+import pickle
+import sqlite3
+import logging as log
+
+from collections import OrderedDict
+
+from .stats import stats
+
+
+logger = log.getLogger('brain2neo')
+
+# entries written to a database per statement
+WRITE_BATCH = 10000
+
+
+def temporary_database():
+    db = sqlite3.connect('')
+    # the database does not outlive the process, nothing to recover
+    db.execute('PRAGMA journal_mode = OFF')
+    db.execute('PRAGMA synchronous = OFF')
+    return db
+
+
+class GuidIndex(object):
+    """
+    Node indices with keys guids, a dict until it holds threshold guids
+    and a sqlite table with an LRU cache of cache_size guids after that.
+    Supports the operations of the dict it replaces in Brain.node_index.
+    """
+
+    def __init__(self, threshold, cache_size):
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.entries = {}
+        self.db = None
+        # recently looked up guids of the database, most recent last
+        self.cache = OrderedDict()
+        self.length = 0
+
+    def __len__(self):
+        return self.length + len(self.entries)
+
+    def __setitem__(self, guid, i):
+        # guids are unique in a brain, an index is never updated
+        self.entries[guid] = i
+        if self.db is None:
+            if len(self.entries) >= self.threshold:
+                self.spill()
+        elif len(self.entries) >= WRITE_BATCH:
+            self.flush()
+
+    def __getitem__(self, guid):
+        i = self.get(guid)
+        if i is None:
+            raise KeyError(guid)
+        return i
+
+    def __contains__(self, guid):
+        return self.get(guid) is not None
+
+    def get(self, guid, default=None):
+        i = self.entries.get(guid)
+        if i is not None or self.db is None:
+            return default if i is None else i
+
+        cache = self.cache
+        i = cache.get(guid)
+        if i is not None:
+            cache.move_to_end(guid)
+            return i
+
+        stats.count('spill_lookups')
+        row = self.db.execute('SELECT i FROM guids WHERE guid = ?',
+                              (guid,)).fetchone()
+        if row is None:
+            return default
+        cache[guid] = row[0]
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return row[0]
+
+    def items(self):
+        if self.db is not None:
+            yield from self.db.execute('SELECT guid, i FROM guids')
+        yield from self.entries.items()
+
+    def spill(self):
+        logger.info('Moving guid index of {} thoughts to disk.'
+                    .format(len(self.entries)))
+        self.db = temporary_database()
+        self.db.execute('CREATE TABLE guids (guid TEXT PRIMARY KEY, '
+                        'i INTEGER) WITHOUT ROWID')
+        self.flush()
+
+    def flush(self):
+        self.db.executemany('INSERT INTO guids VALUES (?, ?)',
+                            self.entries.items())
+        self.length += len(self.entries)
+        self.entries = {}
+
+    def __reduce__(self):
+        # pickled brains (cache, process pool) get an in-memory index
+        return dict, (list(self.items()),)
+
+
+class SpillList(object):
+    """
+    List of records that can only be appended and iterated, pickled to a
+    sqlite table once it holds threshold records.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.records = []
+        self.db = None
+        self.length = 0
+
+    def __len__(self):
+        return self.length + len(self.records)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def append(self, record):
+        self.records.append(record)
+        if self.db is None:
+            if len(self.records) >= self.threshold:
+                self.db = temporary_database()
+                self.db.execute('CREATE TABLE records (record BLOB)')
+                self.flush()
+        elif len(self.records) >= WRITE_BATCH:
+            self.flush()
+
+    def flush(self):
+        self.db.executemany('INSERT INTO records VALUES (?)',
+                            ((pickle.dumps(record, pickle.HIGHEST_PROTOCOL),)
+                             for record in self.records))
+        self.length += len(self.records)
+        self.records = []
+
+    def __iter__(self):
+        # records keep the order they were appended in
+        if self.db is not None:
+            for row in self.db.execute('SELECT record FROM records '
+                                       'ORDER BY rowid'):
+                yield pickle.loads(row[0])
+        yield from self.records
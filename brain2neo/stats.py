@@ -0,0 +1,172 @@
+"""brain2neo.stats: timers, counters and profiles of a run.
+
+Functions decorated with timed are recorded as phases: number of calls,
+total time, wall time during which at least one call was running (less
+than total time for phases run by several threads) and, if memory
+tracing is enabled, peak traced memory. With
+profiling enabled, top level phases are also profiled with cProfile and
+one profile per phase is dumped at the end of the run.
+"""
+
+import os
+import json
+import time
+import cProfile
+import functools
+import threading
+import tracemalloc
+
+from collections import Counter
+
+
+def traced_peak():
+    return tracemalloc.get_traced_memory()[1]
+
+
+class RunStats(object):
+    def __init__(self):
+        self.counters = Counter()
+        # phase dictionaries with keys phase names
+        self.phases = {}
+        # running calls and start of their wall time with keys phase names
+        self.running = Counter()
+        self.wall_starts = {}
+        self.trace_memory = False
+        self.profile_dir = None
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def reset(self):
+        """ Forget everything recorded so far. """
+        self.counters.clear()
+        self.phases.clear()
+        self.running.clear()
+        self.wall_starts.clear()
+        self.profiles.clear()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def merge(self, report):
+        """
+        Add the counters and phases of report, recorded by another
+        process. Wall times of processes are added like their times.
+        """
+        with self.lock:
+            self.counters.update(report['counters'])
+            for name, other in report['phases'].items():
+                phase = self.phases.setdefault(
+                    name, {'calls': 0, 'seconds': 0.0, 'wall_seconds': 0.0,
+                           'peak_bytes': None})
+                for key in ('calls', 'seconds', 'wall_seconds'):
+                    phase[key] += other[key]
+                if other['peak_bytes'] is not None:
+                    phase['peak_bytes'] = max(phase['peak_bytes'] or 0,
+                                              other['peak_bytes'])
+
+    def start(self, trace_memory=False, profile_dir=None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stack(self):
+        # peak memory of open phases of this thread
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def tracing(self):
+        # memory and profiles are only sampled on the main thread,
+        # since both are global to the interpreter
+        return threading.current_thread() is threading.main_thread()
+
+    def enter(self, name):
+        stack = self.stack()
+        profile = None
+        if self.tracing():
+            if self.trace_memory:
+                if stack:
+                    stack[-1] = max(stack[-1], traced_peak())
+                if hasattr(tracemalloc, 'reset_peak'):
+                    tracemalloc.reset_peak()
+            if self.profile_dir is not None and not stack:
+                profile = self.profiles.setdefault(name, cProfile.Profile())
+                profile.enable()
+        stack.append(0)
+        start = time.perf_counter()
+        with self.lock:
+            if not self.running[name]:
+                self.wall_starts[name] = start
+            self.running[name] += 1
+        return profile, start
+
+    def exit(self, name, profile, start):
+        end = time.perf_counter()
+        elapsed = end - start
+        stack = self.stack()
+        peak = stack.pop()
+        if profile is not None:
+            profile.disable()
+        if self.tracing() and self.trace_memory:
+            peak = max(peak, traced_peak())
+            if stack:
+                stack[-1] = max(stack[-1], peak)
+        else:
+            peak = None
+
+        with self.lock:
+            phase = self.phases.setdefault(
+                name, {'calls': 0, 'seconds': 0.0, 'wall_seconds': 0.0,
+                       'peak_bytes': None})
+            phase['calls'] += 1
+            phase['seconds'] += elapsed
+            # calls running across a reset are not counted as running
+            self.running[name] = max(0, self.running[name] - 1)
+            if not self.running[name]:
+                phase['wall_seconds'] += \
+                    end - self.wall_starts.pop(name, start)
+            if peak is not None:
+                phase['peak_bytes'] = max(phase['peak_bytes'] or 0, peak)
+
+    def report(self):
+        report = {'phases': self.phases, 'counters': dict(self.counters)}
+        # concurrent writers overlap, their time adds up beyond the wall
+        # time they took
+        write = self.phases.get('create_entities')
+        if write and write['wall_seconds'] > 0:
+            report['rows_per_second'] = \
+                self.counters['rows_written'] / write['wall_seconds']
+        return report
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+    def dump_profiles(self):
+        if self.profile_dir is None:
+            return
+        if not os.path.isdir(self.profile_dir):
+            os.makedirs(self.profile_dir)
+        for name, profile in self.profiles.items():
+            profile.dump_stats(
+                os.path.join(self.profile_dir, '{}.prof'.format(name)))
+
+
+# statistics of the current run
+stats = RunStats()
+
+
+def timed(function):
+    """ Record calls of function as a phase named after it. """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        profile, start = stats.enter(function.__name__)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.exit(function.__name__, profile, start)
+
+    return wrapper
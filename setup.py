@@ -10,8 +10,12 @@ setup(name='brain2neo',
       packages=['brain2neo'],
       install_requires=[
         'configobj >= 5.0.0',
-        'py2neo == 4.1.3'
+        'py2neo == 4.1.3',
+        'neo4j-driver >= 1.7'
       ],
+      extras_require={
+        'index': ['numpy >= 1.17']
+      },
       include_package_data = True,
       entry_points={
         "console_scripts": ['brain2neo = brain2neo.brain2neo:main']
@@ -0,0 +1,177 @@
+"""In-memory graph running the statements brain2neo writes with.
+
+Statements are recognized by their shape, not parsed, so only the ones
+built by brain2neo are supported. brain2neo.benchmark writes to it too,
+without a server.
+"""
+
+import re
+
+
+NAME = re.compile(r'`((?:[^`]|``)*)`')
+
+
+def names(text):
+    return [name.replace('``', '`') for name in NAME.findall(text)]
+
+
+def pattern_labels(statement, name):
+    """ Labels of node name in the first pattern of statement. """
+    match = re.search(r'\(' + name + r'((?::`(?:[^`]|``)*`)*)\)', statement)
+    return set(names(match.group(1)))
+
+
+def rel_type(statement):
+    return names(re.search(r'\[r:(`(?:[^`]|``)*`)\]', statement).group(1))[0]
+
+
+class MemoryCursor(object):
+    def __init__(self, records):
+        self.records = records
+
+    def data(self):
+        return self.records
+
+    def evaluate(self):
+        if not self.records:
+            return None
+        return next(iter(self.records[0].values()))
+
+
+class MemoryGraph(object):
+    """
+    Nodes and relationships with keys their ids, nodes holding labels and
+    props, relationships type, endpoint ids a and b and props. Nodes and
+    relationships are numbered apart, like in Neo4j. statements holds
+    the statements run with their parameters, n_statements and n_rows
+    count them and their rows, writes counts the rows of statements that
+    change the graph. With keep=False only counts and ids are kept.
+    """
+
+    def __init__(self, keep=True):
+        self.keep = keep
+        self.nodes = {}
+        self.relationships = {}
+        self.statements = []
+        self.n_statements = 0
+        self.n_rows = 0
+        self.next_id = 0
+        self.next_rel_id = 0
+        self.writes = 0
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def new_rel_id(self):
+        self.next_rel_id += 1
+        return self.next_rel_id - 1
+
+    def run(self, statement, parameters=None, **kwparameters):
+        parameters = dict(parameters or {}, **kwparameters)
+        rows = parameters.get('rows', [])
+        self.n_statements += 1
+        self.n_rows += len(rows)
+        if self.keep:
+            self.statements.append((statement, parameters))
+
+        if 'DELETE' in statement or ' SET ' in statement \
+                or 'REMOVE' in statement or 'CREATE' in statement:
+            self.writes += len(rows)
+            return MemoryCursor(self.write(statement, rows))
+        return MemoryCursor(self.read(statement, rows, parameters))
+
+    def write(self, statement, rows):
+        records = []
+        if 'CREATE (n' in statement:
+            labels = pattern_labels(statement, 'n')
+            for row in rows:
+                node_id = self.new_id()
+                if self.keep:
+                    self.nodes[node_id] = {'labels': set(labels),
+                                           'props': props(row['props'])}
+                records.append({'i': row['i'], 'id': node_id})
+        elif 'CREATE (a)' in statement:
+            if not self.keep:
+                return records
+            for row in rows:
+                self.relationships[self.new_rel_id()] = {
+                    'type': rel_type(statement), 'a': row['a'],
+                    'b': row['b'], 'props': props(row['props'])}
+        elif 'DETACH DELETE n' in statement:
+            for node_id in rows:
+                del self.nodes[node_id]
+                for rel_id, r in list(self.relationships.items()):
+                    if node_id in (r['a'], r['b']):
+                        del self.relationships[rel_id]
+        elif 'DELETE r' in statement:
+            for rel_id in rows:
+                del self.relationships[rel_id]
+        elif 'SET n = row.props' in statement:
+            for row in rows:
+                self.nodes[row['id']]['props'] = props(row['props'])
+        elif 'SET n:' in statement:
+            for node_id in rows:
+                self.nodes[node_id]['labels'].update(names(statement))
+        elif 'REMOVE n:' in statement:
+            for node_id in rows:
+                self.nodes[node_id]['labels'].difference_update(
+                    names(statement))
+        return records
+
+    def in_namespace(self, node, statement, name, parameters):
+        if not pattern_labels(statement, name) <= node['labels']:
+            return False
+        if '{}.source = $source'.format(name) in statement:
+            return node['props'].get('source') == parameters['source']
+        return True
+
+    def stored(self, statement, parameters):
+        if 'r.guid IS NOT NULL' in statement:
+            return [{'id': rel_id, 'guid': r['props'].get('guid'),
+                     'modified': r['props'].get('modified'),
+                     'type': r['type'],
+                     'a': self.nodes[r['a']]['props'].get('guid'),
+                     'b': self.nodes[r['b']]['props'].get('guid')}
+                    for rel_id, r in self.relationships.items()
+                    if 'guid' in r['props'] and self.in_namespace(
+                        self.nodes[r['a']], statement, 'a', parameters)]
+        return [{'id': node_id, 'guid': node['props']['guid'],
+                 'modified': node['props'].get('modified'),
+                 'labels': sorted(node['labels'])}
+                for node_id, node in self.nodes.items()
+                if 'guid' in node['props'] and self.in_namespace(
+                    node, statement, 'n', parameters)]
+
+    def read(self, statement, rows, parameters):
+        if 'ORDER BY id LIMIT $limit' in statement:
+            records = sorted(self.stored(statement, parameters),
+                             key=lambda record: record['id'])
+            return [record for record in records
+                    if record['id'] > parameters['after']
+                    ][:parameters['limit']]
+        elif 'properties(n) AS props' in statement:
+            return [{'id': node_id,
+                     'props': dict(self.nodes[node_id]['props'])}
+                    for node_id in rows]
+        elif 'RETURN row.i AS i, id(n) AS id' in statement:
+            keys = re.findall(r'n\.(\w+) = row\.props\.', statement)
+            labels = pattern_labels(statement, 'n')
+            return [{'i': row['i'], 'id': node_id} for row in rows
+                    for node_id, node in self.nodes.items()
+                    if labels <= node['labels'] and
+                    all(node['props'].get(k) == row['props'][k]
+                        for k in keys)]
+        elif 'count(r) AS n' in statement:
+            t = rel_type(statement)
+            return [{'a': row['a'], 'b': row['b'],
+                     'n': sum(1 for r in self.relationships.values()
+                              if (r['type'], r['a'], r['b'])
+                              == (t, row['a'], row['b']))}
+                    for row in rows]
+        return []
+
+
+def props(values):
+    # null properties are not stored
+    return {k: v for k, v in values.items() if v is not None}
@@ -3,9 +3,27 @@
 import unittest
 
 import test_example
+import test_batch
+import test_bolt
+import test_cache
+import test_export
+import test_generate
+import test_incremental
+import test_index
+import test_journal
+import test_parse
+import test_retry
+import test_spill
+import test_startup
+import test_stats
+import test_throttle
+import test_write
 
 
-modules = [test_example]
+modules = [test_example, test_batch, test_bolt, test_cache, test_export,
+           test_generate, test_incremental, test_index, test_journal,
+           test_parse, test_retry, test_spill, test_startup, test_stats,
+           test_throttle, test_write]
 
 suites = [m.test_suite() for m in modules]
 
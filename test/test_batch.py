@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+from brain2neo import batch
+from brain2neo.batch import convert_files, parse_file, xml_files
+from brain2neo.generate import write_brain
+from brain2neo.stats import stats
+from memory_graph import MemoryGraph
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        for n in range(3):
+            write_brain(os.path.join(self.work_dir, 'b{}.xml'.format(n)),
+                        thoughts=100 * (n + 1), links=200, seed=n)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_xml_files(self):
+        self.assertEqual(xml_files(self.work_dir),
+                         xml_files(os.path.join(self.work_dir, 'b*.xml')))
+        self.assertEqual(len(xml_files(self.work_dir)), 3)
+
+    def test_source_namespace(self):
+        xml_file = os.path.join(self.work_dir, 'b0.xml')
+        cfg = b2n.get_cfg(xml_file)
+        cfg['Convert']['source_namespace'] = 'property'
+        tree = b2n.parse_root(b2n.get_root(xml_file), cfg)
+        stream = b2n.stream_brain(xml_file, cfg)
+        self.assertIsNotNone(stream.source)
+        self.assertEqual(tree.source, stream.source)
+        self.assertEqual(stream.node_properties(0)['source'], stream.source)
+
+        cfg['Convert']['source_namespace'] = 'label'
+        brain = b2n.stream_brain(xml_file, cfg)
+        label = b2n.source_label(stream.source)
+        for labels in brain.node_labels:
+            self.assertIn(label, labels)
+
+    def test_sharded_worker(self):
+        xml_file = os.path.join(self.work_dir, 'b0.xml')
+        with open(os.path.join(self.work_dir, 'b0.cfg'), 'w') as f:
+            f.write('[Parse]\nparser = sharded\nparse_jobs = 2\n')
+        with self.assertLogs('brain2neo', 'INFO') as logs:
+            brain = parse_file(xml_file)
+
+        self.assertIn('in a single process', ' '.join(logs.output))
+        self.assertEqual(brain.node_guids,
+                         b2n.expat_brain(xml_file, b2n.get_cfg(xml_file))
+                         .node_guids)
+
+    def test_export(self):
+        output_dir = os.path.join(self.work_dir, 'csv')
+        cfgs = {xml_file: b2n.get_cfg(xml_file)
+                for xml_file in xml_files(self.work_dir)}
+        errors = convert_files(cfgs, jobs=2, output_dir=output_dir)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(sorted(os.listdir(output_dir)), ['b0', 'b1', 'b2'])
+
+    def memory_graph(self):
+        graph = MemoryGraph()
+        get_graph = batch.get_graph
+        batch.get_graph = lambda cfg: graph
+        self.addCleanup(setattr, batch, 'get_graph', get_graph)
+        return graph
+
+    def test_stats(self):
+        self.memory_graph()
+        files = xml_files(self.work_dir)
+        cfgs = {xml_file: b2n.get_cfg(xml_file) for xml_file in files}
+        cfgs[files[0]]['Neo4j']['pipelined'] = True
+
+        stats.reset()
+        self.addCleanup(stats.reset)
+        with self.assertLogs('brain2neo', 'WARNING') as logs:
+            errors = convert_files(cfgs, jobs=2)
+        self.assertEqual(errors, {})
+        self.assertIn('Ignoring pipelined for {}'.format(files[0]),
+                      ' '.join(logs.output))
+
+        # counters of the parse workers are merged
+        counters = dict(stats.counters)
+        phases = dict(stats.phases)
+        stats.reset()
+        for xml_file in files:
+            parse_file(xml_file)
+        self.assertEqual(counters['thoughts'], stats.counters['thoughts'])
+        self.assertEqual(counters['links'], stats.counters['links'])
+        self.assertGreater(counters['rows_written'], 0)
+        for name, phase in stats.phases.items():
+            self.assertEqual(phases[name]['calls'], phase['calls'])
+
+    def test_resume(self):
+        graph = self.memory_graph()
+
+        files = xml_files(self.work_dir)
+        cfgs = {xml_file: b2n.get_cfg(xml_file) for xml_file in files}
+        brains = [parse_file(xml_file) for xml_file in files]
+        # an interrupted batch that completed b0, began b1 and not b2
+        batch.write_brain(files[0], brains[0], cfgs[files[0]],
+                          b2n.GraphPool([graph]))
+        b2n.get_journal(files[1], cfgs[files[1]]).start()
+        n_nodes = len(graph.nodes)
+
+        with self.assertLogs('brain2neo', 'INFO') as logs:
+            errors = convert_files(cfgs, jobs=2, resume=True)
+
+        self.assertEqual(errors, {})
+        self.assertIn('Skipping {}'.format(files[0]), ' '.join(logs.output))
+        self.assertEqual(len(graph.nodes) - n_nodes,
+                         brains[1].node_count() + brains[2].node_count())
+        self.assertEqual(len(graph.relationships),
+                         sum(b.relationship_count() for b in brains))
+        # markers and journals are removed once the batch is complete
+        self.assertFalse([name for name in os.listdir(self.work_dir)
+                          if name.endswith(('.done', '.journal'))])
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(BatchTestCase),
+    ])
@@ -0,0 +1,60 @@
+#!/usr/bin/python
+
+import os
+import time
+import shutil
+import socket
+import subprocess
+
+from unittest import TestCase, TestLoader, TestSuite, skipIf
+
+import brain2neo.brain2neo as b2n
+
+
+BOLTSTUB = shutil.which('boltstub')
+PORT = 17687
+
+
+def wait_for_port(port, timeout=10.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+@skipIf(BOLTSTUB is None, 'boltstub (boltkit) is not installed')
+class BoltTestCase(TestCase):
+    def run_stub(self, script):
+        script = os.path.join(os.path.dirname(__file__), 'scripts', script)
+        self.stub = subprocess.Popen([BOLTSTUB, str(PORT), script])
+        self.assertTrue(wait_for_port(PORT))
+
+    def tearDown(self):
+        from brain2neo.bolt import close_drivers
+        close_drivers()
+        self.assertEqual(self.stub.wait(10), 0)
+
+    def test_create_nodes(self):
+        self.run_stub('create_nodes.script')
+
+        cfg = b2n.get_cfg('example.xml')
+        cfg['Neo4j']['neo4j_uri'] = 'bolt://127.0.0.1:{}'.format(PORT)
+        graph = b2n.get_graph(cfg)
+
+        rows = [{'i': 0, 'props': {'name': 'A'}},
+                {'i': 1, 'props': {'name': 'B'}}]
+        records = graph.run(b2n.create_nodes_statement(frozenset(['Type'])),
+                            rows=rows).data()
+        graph.close()
+
+        self.assertEqual(records, [{'i': 0, 'id': 10}, {'i': 1, 'id': 11}])
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(BoltTestCase),
+    ])
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+from brain2neo import cache
+from brain2neo.cache import BrainCache, cache_key
+from brain2neo.generate import write_brain
+
+
+class CacheTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.xml_file = os.path.join(self.work_dir, 'generated.xml')
+        write_brain(self.xml_file, thoughts=200, links=400, seed=2)
+        self.cfg = b2n.get_cfg(self.xml_file)
+        self.cfg['Parse']['cache_dir'] = os.path.join(self.work_dir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_load(self):
+        brain = b2n.read_brain(self.xml_file, self.cfg)
+        cached = b2n.read_brain(self.xml_file, self.cfg)
+
+        self.assertEqual(len(os.listdir(self.cfg['Parse']['cache_dir'])), 1)
+        self.assertEqual(cached.node_guids, brain.node_guids)
+        self.assertEqual(cached.node_labels, brain.node_labels)
+        self.assertEqual(list(cached.rel_ends), list(brain.rel_ends))
+        self.assertEqual(cached.rel_types, brain.rel_types)
+
+    def test_key(self):
+        key = cache_key('hash', self.cfg)
+        self.cfg['Neo4j']['neo4j_uri'] = 'bolt://localhost:7687'
+        self.assertEqual(cache_key('hash', self.cfg), key)
+        self.cfg['Convert']['upper_link_names'] = False
+        self.assertNotEqual(cache_key('hash', self.cfg), key)
+
+        key = cache_key('hash', self.cfg)
+        self.addCleanup(setattr, cache, 'CACHE_FORMAT', cache.CACHE_FORMAT)
+        cache.CACHE_FORMAT += 1
+        self.assertNotEqual(cache_key('hash', self.cfg), key)
+
+    def test_stale(self):
+        brain_cache = BrainCache(self.cfg['Parse']['cache_dir'], 2 ** 20)
+        # pickles of classes that were renamed or moved
+        for key, data in (('a', b'cbrain2neo.brain2neo\nNoSuchBrain\n.'),
+                          ('b', b'cno_such_module\nBrain\n.')):
+            with open(brain_cache.path(key), 'wb') as f:
+                f.write(data)
+            with self.assertLogs('brain2neo', 'WARNING'):
+                self.assertIsNone(brain_cache.load(key))
+
+    def test_evict(self):
+        cache = BrainCache(self.cfg['Parse']['cache_dir'], 1)
+        brain = b2n.parse_brain(self.xml_file, self.cfg)
+        cache.store('a', brain)
+        cache.store('b', brain)
+
+        self.assertIsNone(cache.load('a'))
+        self.assertIsNotNone(cache.load('b'))
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(CacheTestCase),
+    ])
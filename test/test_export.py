@@ -0,0 +1,59 @@
+#!/usr/bin/python
+
+import os
+import csv
+import shutil
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+import brain2neo.export as export
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        xml_file = "example.xml"
+        cfg = b2n.get_cfg(xml_file)
+        brain = b2n.read_brain(xml_file, cfg)
+
+        self.output_dir = tempfile.mkdtemp()
+        export.write_csv(self.output_dir, brain)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def read_rows(self, name):
+        with open(os.path.join(self.output_dir, name), newline='',
+                  encoding='utf-8') as f:
+            return list(csv.reader(f))
+
+    def test_nodes(self):
+        rows = self.read_rows(export.NODES_FILE)
+        header = rows[0]
+        self.assertEqual(header[0], ':ID')
+        self.assertEqual(header[1], 'name')
+        self.assertEqual(header[-1], ':LABEL')
+        self.assertEqual(len(rows) - 1, 19)
+
+        names = [row[1] for row in rows[1:]]
+        self.assertIn('Example', names)
+
+    def test_relationships(self):
+        rows = self.read_rows(export.RELATIONSHIPS_FILE)
+        self.assertEqual(rows[0], [':START_ID', ':END_ID', ':TYPE'])
+        self.assertEqual(len(rows) - 1, 32)
+
+        ids = set(row[0] for row in self.read_rows(export.NODES_FILE)[1:])
+        for row in rows[1:]:
+            self.assertIn(row[0], ids)
+            self.assertIn(row[1], ids)
+        self.assertIn('BASED ON', [row[2] for row in rows[1:]])
+
+
+def test_suite():
+    suite = TestSuite()
+    for test_class in (ExportTestCase,):
+        tests = TestLoader().loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
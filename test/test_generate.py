@@ -0,0 +1,183 @@
+#!/usr/bin/python
+
+import os
+import time
+import queue
+import shutil
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+from brain2neo import pipeline
+from brain2neo.generate import write_brain
+from brain2neo.pipeline import (Emitter, Writer, convert_pipelined,
+                                read_records)
+from memory_graph import MemoryGraph
+
+
+class GenerateTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.xml_file = os.path.join(self.work_dir, 'generated.xml')
+        write_brain(self.xml_file, thoughts=300, types=5, links=600,
+                    link_types=3, attachments=50, forgotten=0.1,
+                    private=0.1, seed=1)
+        self.cfg = b2n.get_cfg(self.xml_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_tree_and_stream(self):
+        tree = b2n.parse_root(b2n.get_root(self.xml_file), self.cfg)
+        stream = b2n.stream_brain(self.xml_file, self.cfg)
+
+        self.assertEqual(tree.node_guids, stream.node_guids)
+        self.assertEqual(tree.node_labels, stream.node_labels)
+        self.assertEqual(tree.rel_types, stream.rel_types)
+        self.assertEqual(list(tree.rel_starts), list(stream.rel_starts))
+        self.assertEqual(list(tree.rel_ends), list(stream.rel_ends))
+
+    def test_ignored(self):
+        brain = b2n.stream_brain(self.xml_file, self.cfg)
+        # forgotten thoughts are ignored by default
+        self.assertLess(brain.node_count(), 300)
+        self.assertGreater(brain.node_count(), 200)
+        self.assertTrue(any(brain.node_labels))
+
+    def test_store(self):
+        brain = b2n.stream_brain(self.xml_file, self.cfg)
+        graph = MemoryGraph()
+        b2n.store_entities(graph, brain, self.cfg)
+
+        self.assertEqual(graph.next_id, brain.node_count())
+        self.assertEqual(graph.n_rows,
+                         brain.node_count() + brain.relationship_count())
+        for statement, parameters in graph.statements:
+            self.assertTrue(statement.startswith('UNWIND $rows AS row'))
+
+    def test_schema(self):
+        self.cfg['Neo4j']['schema'] = True
+        brain = b2n.stream_brain(self.xml_file, self.cfg)
+        for labels in brain.node_labels:
+            self.assertIn('Thought', labels)
+
+        graph = MemoryGraph()
+        b2n.store_entities(graph, brain, self.cfg)
+
+        statements = [statement for statement, _ in graph.statements]
+        schema = [n for n, statement in enumerate(statements)
+                  if not statement.startswith('UNWIND')]
+        nodes = [n for n, statement in enumerate(statements)
+                 if 'CREATE (n' in statement]
+        relationships = [n for n, statement in enumerate(statements)
+                         if 'CREATE (a)' in statement]
+        # one constraint and a name index per label, between the loads
+        self.assertEqual(len(schema), 7)
+        self.assertTrue(statements[schema[0]].startswith('CREATE CONSTRAINT'))
+        self.assertLess(max(nodes), min(schema))
+        self.assertLess(max(schema), min(relationships))
+
+    def test_timestamps(self):
+        self.assertEqual(
+            b2n.brain_datetime('2016-01-13 15:03:30.201 @-0500'),
+            '2016-01-13T15:03:30.201-05:00')
+        self.assertIsNone(b2n.brain_datetime(None))
+
+        self.cfg['Convert']['timestamps'] = True
+        brain = b2n.stream_brain(self.xml_file, self.cfg)
+        props = brain.node_properties(0)
+        for key in b2n.NODE_TIMESTAMPS:
+            self.assertIn('T', props[key])
+        self.assertIn('modified_at', brain.relationship_properties(0))
+
+        graph = MemoryGraph()
+        b2n.store_entities(graph, brain, self.cfg)
+        for statement, parameters in graph.statements:
+            self.assertIn('= datetime(', statement)
+
+    def pipeline(self, graph):
+        brain = b2n.new_brain(self.cfg)
+        batches = queue.Queue(2)
+        writer = self.writer = Writer(graph, brain, self.cfg, batches)
+        writer.start()
+        try:
+            with b2n.open_xml(self.xml_file) as f:
+                convert_pipelined(read_records(f, self.cfg), brain,
+                                  self.cfg, Emitter(brain, batches, 50,
+                                                    writer))
+        finally:
+            batches.put(None)
+            writer.join()
+        return brain
+
+    def test_pipelined(self):
+        graph = MemoryGraph()
+        brain = self.pipeline(graph)
+
+        self.assertIsNone(self.writer.error)
+        stream = b2n.stream_brain(self.xml_file, self.cfg)
+        self.assertEqual(brain.node_labels, stream.node_labels)
+        self.assertEqual(brain.rel_types, stream.rel_types)
+        self.assertEqual(graph.next_id, brain.node_count())
+        labels = 0
+        for statement, parameters in graph.statements:
+            rows = parameters['rows']
+            if 'CREATE (a)' in statement:
+                for row in rows:
+                    self.assertIsNotNone(row['a'])
+                    self.assertIsNotNone(row['b'])
+            elif 'CREATE (n' in statement:
+                created = statement.split('CREATE (n')[1].split(')')[0]
+                labels += created.count(':') * len(rows)
+            elif 'SET n:' in statement:
+                labels += len(rows)
+        # labels are written with nodes or set once they are known
+        self.assertEqual(labels, sum(len(node_labels)
+                                     for node_labels in brain.node_labels))
+
+    def test_pipelined_source(self):
+        self.cfg['Convert']['source_namespace'] = 'label'
+        graph = MemoryGraph()
+        brain = self.pipeline(graph)
+
+        self.assertIsNotNone(brain.source_label)
+        for node_labels in brain.node_labels:
+            self.assertIn(brain.source_label, node_labels)
+        # the Source label is sent with the nodes, not set afterwards
+        self.assertFalse([statement for statement, _ in graph.statements
+                          if brain.source_label in statement
+                          and 'SET n:' in statement])
+
+    def test_pipelined_error(self):
+        class FailingGraph(MemoryGraph):
+            def run(self, statement, parameters=None, **kwparameters):
+                raise ValueError('write failed')
+
+        converted = []
+        add_thought = pipeline.add_thought
+
+        def counted(record, brain, types, cfg):
+            converted.append(record)
+            add_thought(record, brain, types, cfg)
+            # let the writer fail on the batches sent so far
+            if len(converted) == 100:
+                for _ in range(500):
+                    if self.writer.error is not None:
+                        break
+                    time.sleep(0.01)
+        pipeline.add_thought = counted
+        self.addCleanup(setattr, pipeline, 'add_thought', add_thought)
+
+        with self.assertRaises(ValueError):
+            self.pipeline(FailingGraph())
+        # conversion stops soon after the first batch failed
+        self.assertLess(len(converted), 200)
+
+
+def test_suite():
+    suite = TestSuite()
+    for test_class in (GenerateTestCase,):
+        tests = TestLoader().loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
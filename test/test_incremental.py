@@ -0,0 +1,123 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+from xml.etree import ElementTree
+
+import brain2neo.brain2neo as b2n
+from brain2neo.generate import write_brain
+from brain2neo import incremental
+from brain2neo.incremental import update_entities
+from memory_graph import MemoryGraph
+
+
+class IncrementalTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cfg = b2n.get_cfg('example.xml')
+        self.cfg['Neo4j']['incremental'] = True
+        self.graph = MemoryGraph()
+        # read the stored entities in many pages
+        self.read_page = incremental.READ_PAGE
+        incremental.READ_PAGE = 7
+
+    def tearDown(self):
+        incremental.READ_PAGE = self.read_page
+        shutil.rmtree(self.work_dir)
+
+    def update(self, brain):
+        writes = self.graph.writes
+        update_entities(self.graph, brain, self.cfg)
+        return self.graph.writes - writes
+
+    def names(self):
+        return sorted(node['props']['name']
+                      for node in self.graph.nodes.values())
+
+    def without_thought(self, name):
+        """ Brain of example.xml without the thought called name. """
+        tree = ElementTree.parse('example.xml')
+        thoughts = tree.find('Thoughts')
+        for thought in thoughts.findall('Thought'):
+            if thought.find('name').text == name:
+                thoughts.remove(thought)
+        xml_file = os.path.join(self.work_dir, 'example.xml')
+        tree.write(xml_file)
+        return b2n.parse_brain(xml_file, self.cfg)
+
+    def test_unchanged(self):
+        brain = b2n.parse_brain('example.xml', self.cfg)
+        # thoughts without modification time are never stored with one
+        brain.node_modified[0] = None
+        self.assertGreater(self.update(brain), 0)
+        self.assertEqual(self.update(brain), 0)
+        self.assertEqual(self.names(), sorted(brain.node_names))
+
+    def test_changed(self):
+        brain = b2n.parse_brain('example.xml', self.cfg)
+        self.update(brain)
+        i = brain.node_names.index('MGMT')
+        brain.node_names[i] = 'Empire of the Sun'
+        brain.node_modified[i] = '2030-01-01T00:00:00'
+
+        self.assertEqual(self.update(brain), 1)
+        self.assertIn('Empire of the Sun', self.names())
+        self.assertNotIn('MGMT', self.names())
+
+    def test_undated(self):
+        brain = b2n.parse_brain('example.xml', self.cfg)
+        i = brain.node_names.index('MGMT')
+        brain.node_modified[i] = None
+        self.update(brain)
+
+        # only thoughts without modification time are compared by their
+        # properties
+        brain.node_names[i] = 'Empire of the Sun'
+        brain.node_names[i - 1] = 'Unnoticed'
+        self.assertEqual(self.update(brain), 1)
+        self.assertIn('Empire of the Sun', self.names())
+        self.assertNotIn('Unnoticed', self.names())
+
+    def test_added_deleted(self):
+        brain = b2n.parse_brain('example.xml', self.cfg)
+        smaller = self.without_thought('MGMT')
+        self.update(smaller)
+        self.assertNotIn('MGMT', self.names())
+        n_relationships = len(self.graph.relationships)
+
+        self.update(brain)
+        self.assertEqual(self.names(), sorted(brain.node_names))
+        self.assertEqual(len(self.graph.relationships),
+                         brain.relationship_count())
+
+        self.update(smaller)
+        self.assertEqual(self.names(), sorted(smaller.node_names))
+        self.assertEqual(len(self.graph.relationships), n_relationships)
+
+    def test_namespace(self):
+        for namespace in ('label', 'property'):
+            self.graph = MemoryGraph()
+            self.cfg['Convert']['source_namespace'] = namespace
+            brains = []
+            for seed in (1, 2):
+                xml_file = os.path.join(self.work_dir, 'b{}.xml'.format(seed))
+                write_brain(xml_file, thoughts=50, links=100, seed=seed)
+                brains.append(b2n.parse_brain(xml_file, self.cfg))
+            for brain in brains:
+                self.update(brain)
+
+            # updating one brain leaves the other alone
+            self.assertEqual(self.update(brains[0]), 0)
+            self.assertEqual(len(self.graph.nodes),
+                             sum(b.node_count() for b in brains))
+            self.assertEqual(len(self.graph.relationships),
+                             sum(b.relationship_count() for b in brains))
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(IncrementalTestCase),
+    ])
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+
+from collections import Counter
+from unittest import TestCase, TestLoader, TestSuite, skipIf
+
+import brain2neo.brain2neo as b2n
+from brain2neo.generate import write_brain
+
+try:
+    from brain2neo.index import GraphIndex
+except ImportError:
+    GraphIndex = None
+
+
+@skipIf(GraphIndex is None, 'numpy is not installed')
+class IndexTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        xml_file = os.path.join(self.work_dir, 'generated.xml')
+        write_brain(xml_file, thoughts=300, types=5, links=600,
+                    link_types=3, seed=5)
+        self.brain = b2n.stream_brain(xml_file, b2n.get_cfg(xml_file))
+        self.index = GraphIndex.from_brain(self.brain)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_counts(self):
+        brain = self.brain
+        labels = Counter(label for labels in brain.node_labels
+                         for label in labels)
+        self.assertEqual(self.index.label_counts(), dict(labels))
+        for label, count in labels.items():
+            self.assertEqual(self.index.count(label), count)
+        self.assertEqual(self.index.count('Missing'), 0)
+        self.assertEqual(self.index.type_counts(),
+                         dict(Counter(brain.rel_types)))
+
+    def test_degree(self):
+        brain = self.brain
+        rel_type = brain.rel_types[0]
+        out_degree = Counter(brain.rel_starts[j]
+                             for j in range(brain.relationship_count())
+                             if brain.rel_types[j] == rel_type)
+        in_degree = Counter(brain.rel_ends)
+
+        degree = self.index.degree(rel_type)
+        self.assertEqual([int(degree[i]) for i in range(len(degree))],
+                         [out_degree[i] for i in range(len(degree))])
+        degree = self.index.degree(direction='in')
+        self.assertEqual([int(degree[i]) for i in range(len(degree))],
+                         [in_degree[i] for i in range(len(degree))])
+
+    def test_neighborhood(self):
+        brain = self.brain
+        neighbors = {}
+        for a, b in zip(brain.rel_starts, brain.rel_ends):
+            neighbors.setdefault(a, set()).add(b)
+            neighbors.setdefault(b, set()).add(a)
+        expected = {0}
+        for _ in range(2):
+            expected |= set().union(*(neighbors.get(i, ())
+                                      for i in expected))
+
+        self.assertEqual(list(self.index.neighborhood(0, k=2)),
+                         sorted(expected))
+
+    def test_save_load(self):
+        index_dir = os.path.join(self.work_dir, 'index')
+        self.index.save(index_dir)
+        loaded = GraphIndex.load(index_dir)
+
+        self.assertEqual(loaded.label_counts(), self.index.label_counts())
+        self.assertEqual(loaded.name(3), self.brain.node_names[3])
+        self.assertEqual(loaded.node(self.brain.node_guids[3]), 3)
+        label = loaded.labels[0]
+        self.assertEqual(loaded.top(label, n=3), self.index.top(label, n=3))
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(IndexTestCase),
+    ])
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+from memory_graph import MemoryGraph
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingGraph(MemoryGraph):
+    """
+    MemoryGraph whose write after crash_after writes is committed but
+    raises Crash, like a process dying before the batch is journaled.
+    """
+
+    def __init__(self, crash_after):
+        MemoryGraph.__init__(self)
+        self.crash_after = crash_after
+
+    def write(self, statement, rows):
+        records = MemoryGraph.write(self, statement, rows)
+        if self.crash_after is not None:
+            self.crash_after -= 1
+            if self.crash_after < 0:
+                raise Crash()
+        return records
+
+
+class JournalTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.xml_file = os.path.join(self.work_dir, 'example.xml')
+        shutil.copy('example.xml', self.xml_file)
+        self.cfg = b2n.get_cfg(self.xml_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_restart(self):
+        journal = b2n.get_journal(self.xml_file, self.cfg)
+        journal.start()
+        journal.write({'relationships': [0, 1]})
+        journal.f.close()
+
+        # an interrupted import is kept unless a restart is asked for
+        with self.assertRaises(b2n.JournalError):
+            b2n.get_journal(self.xml_file, self.cfg).start()
+        with open(journal.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+        journal = b2n.get_journal(self.xml_file, self.cfg)
+        journal.start(restart=True)
+        journal.finish()
+        self.assertFalse(os.path.exists(journal.path))
+
+    def test_resume(self):
+        self.cfg['Neo4j']['batch_size'] = 4
+        brain = b2n.parse_brain(self.xml_file, self.cfg)
+        # crash in the node and in the relationship batches
+        for crash_after in (2, 14):
+            graph = CrashingGraph(crash_after)
+            journal = b2n.get_journal(self.xml_file, self.cfg)
+            journal.start(restart=True)
+            with self.assertRaises(Crash):
+                b2n.store_entities(graph, brain, self.cfg, journal)
+            journal.f.close()
+
+            graph.crash_after = None
+            journal = b2n.get_journal(self.xml_file, self.cfg)
+            journal.resume()
+            b2n.store_entities(graph, brain, self.cfg, journal)
+            journal.finish()
+
+            self.assertEqual(len(graph.nodes), brain.node_count())
+            self.assertEqual(len(graph.relationships),
+                             brain.relationship_count())
+            self.assertEqual(sorted(n['props']['name']
+                                    for n in graph.nodes.values()),
+                             sorted(brain.node_names))
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(JournalTestCase),
+    ])
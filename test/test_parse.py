@@ -0,0 +1,187 @@
+#!/usr/bin/python
+
+import os
+import gzip
+import shutil
+import zipfile
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+from brain2neo import shard
+from brain2neo.fastparse import expat_records
+
+
+def assert_same_brain(test, brain, other):
+    test.assertEqual(brain.node_guids, other.node_guids)
+    test.assertEqual(brain.node_names, other.node_names)
+    test.assertEqual(brain.node_labels, other.node_labels)
+    test.assertEqual(brain.node_extra, other.node_extra)
+    test.assertEqual(brain.rel_guids, other.rel_guids)
+    test.assertEqual(brain.rel_types, other.rel_types)
+    test.assertEqual(list(brain.rel_starts), list(other.rel_starts))
+    test.assertEqual(list(brain.rel_ends), list(other.rel_ends))
+
+
+class StreamTestCase(TestCase):
+    def setUp(self):
+        self.xml_file = 'example.xml'
+        self.cfg = b2n.get_cfg(self.xml_file)
+
+    def test_brain(self):
+        tree = b2n.parse_root(b2n.get_root(self.xml_file), self.cfg)
+        with open(self.xml_file, 'rb') as f:
+            stream = b2n.stream_brain(f, self.cfg)
+        assert_same_brain(self, tree, stream)
+
+        self.cfg['Convert']['ignore_attachments'] = True
+        self.cfg['Convert']['sibl_mode'] = '2way'
+        assert_same_brain(self,
+                          b2n.parse_root(b2n.get_root(self.xml_file),
+                                         self.cfg),
+                          b2n.stream_brain(self.xml_file, self.cfg))
+
+    def test_elements(self):
+        elements = [(section, element.tag) for section, element
+                    in b2n.iterparse_brain(self.xml_file)]
+        self.assertEqual(elements.count(('Thoughts', 'Thought')), 32)
+        self.assertIn(('Attachments', 'Attachment'), elements)
+
+
+class LinksTestCase(TestCase):
+    def setUp(self):
+        self.cfg = b2n.get_cfg('example.xml')
+        self.root = b2n.get_root('example.xml')
+        self.links = [b2n.link_record(link) for link
+                      in self.root.find('Links').findall('Link')]
+
+    def convert(self, links):
+        brain, types = b2n.parse_thoughts(self.root, self.cfg)
+        converter = b2n.LinkConverter(brain, types, self.cfg)
+        for link in links:
+            converter.add(link)
+        return converter.finish()
+
+    def test_late_link_types(self):
+        brain = self.convert(self.links)
+        typed = [link for link in self.links if not b2n.is_link_type(link)
+                 and link.link_type_id]
+        self.assertTrue(typed)
+
+        # link types after the links that use them
+        late = self.convert(
+            [link for link in self.links if not b2n.is_link_type(link)] +
+            [link for link in self.links if b2n.is_link_type(link)])
+
+        self.assertEqual(
+            sorted(zip(late.rel_guids, late.rel_types,
+                       late.rel_starts, late.rel_ends)),
+            sorted(zip(brain.rel_guids, brain.rel_types,
+                       brain.rel_starts, brain.rel_ends)))
+        for link in typed:
+            j = brain.rel_guids.index(link.guid)
+            self.assertNotIn(brain.rel_types[j], ('CHILD', 'RELATED'))
+
+
+class ExpatTestCase(TestCase):
+    def setUp(self):
+        self.xml_file = 'example.xml'
+        self.cfg = b2n.get_cfg(self.xml_file)
+
+    def test_records(self):
+        self.assertEqual(list(expat_records(self.xml_file)),
+                         list(b2n.element_records(self.xml_file)))
+        self.assertEqual(list(expat_records(self.xml_file, False)),
+                         list(b2n.element_records(self.xml_file, False)))
+
+    def test_brain(self):
+        stream = b2n.stream_brain(self.xml_file, self.cfg)
+        expat = b2n.expat_brain(self.xml_file, self.cfg)
+
+        self.assertEqual(expat.node_guids, stream.node_guids)
+        self.assertEqual(expat.node_names, stream.node_names)
+        self.assertEqual(expat.node_labels, stream.node_labels)
+        self.assertEqual(expat.node_extra, stream.node_extra)
+        self.assertEqual(expat.rel_types, stream.rel_types)
+        self.assertEqual(list(expat.rel_starts), list(stream.rel_starts))
+        self.assertEqual(list(expat.rel_ends), list(stream.rel_ends))
+
+
+class ShardTestCase(TestCase):
+    def setUp(self):
+        self.xml_file = 'example.xml'
+        self.cfg = b2n.get_cfg(self.xml_file)
+        self.cfg['Parse']['parse_jobs'] = 2
+        # split the small example in many ranges
+        self.min_range_bytes = shard.MIN_RANGE_BYTES
+        shard.MIN_RANGE_BYTES = 256
+
+    def tearDown(self):
+        shard.MIN_RANGE_BYTES = self.min_range_bytes
+
+    def test_split(self):
+        with open(self.xml_file, 'rb') as f:
+            data = f.read()
+        start, end = shard.section_contents(data, b'Links')
+        ranges = shard.split_range(data, start, end, b'<Link>', 8)
+
+        self.assertEqual(len(ranges), 8)
+        self.assertEqual(ranges[0][0], start)
+        self.assertEqual(ranges[-1][1], end)
+        for a, b in ranges[1:]:
+            self.assertTrue(data.startswith(b'<Link>', a))
+
+    def test_brain(self):
+        expat = b2n.expat_brain(self.xml_file, self.cfg)
+        sharded = shard.sharded_brain(self.xml_file, self.cfg)
+
+        self.assertEqual(sharded.node_guids, expat.node_guids)
+        self.assertEqual(sharded.node_names, expat.node_names)
+        self.assertEqual(sharded.node_labels, expat.node_labels)
+        self.assertEqual(sharded.node_extra, expat.node_extra)
+        self.assertEqual(sharded.rel_types, expat.rel_types)
+        self.assertEqual(list(sharded.rel_starts), list(expat.rel_starts))
+        self.assertEqual(list(sharded.rel_ends), list(expat.rel_ends))
+
+
+class CompressedTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cfg = b2n.get_cfg('example.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_brain_base(self):
+        self.assertEqual(b2n.brain_base('a/brain.xml'), 'a/brain')
+        self.assertEqual(b2n.brain_base('a/brain.xml.gz'), 'a/brain')
+        self.assertEqual(b2n.brain_base('a/brain.XML.bz2'), 'a/brain')
+        self.assertEqual(b2n.brain_base('a/brain.zip'), 'a/brain')
+
+    def test_read(self):
+        gz_file = os.path.join(self.work_dir, 'example.xml.gz')
+        with open('example.xml', 'rb') as f, gzip.open(gz_file, 'wb') as gz:
+            shutil.copyfileobj(f, gz)
+        zip_file = os.path.join(self.work_dir, 'example.zip')
+        with zipfile.ZipFile(zip_file, 'w') as archive:
+            archive.writestr('notes.txt', 'not a brain')
+            archive.write('example.xml', 'brain/example.xml')
+
+        brain = b2n.read_brain('example.xml', self.cfg)
+        for xml_file in (gz_file, zip_file):
+            for parser in ('tree', 'stream', 'expat'):
+                self.cfg['Parse']['parser'] = parser
+                other = b2n.read_brain(xml_file, self.cfg)
+                self.assertEqual(other.node_guids, brain.node_guids)
+                self.assertEqual(list(other.rel_ends), list(brain.rel_ends))
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(StreamTestCase),
+        TestLoader().loadTestsFromTestCase(LinksTestCase),
+        TestLoader().loadTestsFromTestCase(ExpatTestCase),
+        TestLoader().loadTestsFromTestCase(ShardTestCase),
+        TestLoader().loadTestsFromTestCase(CompressedTestCase),
+    ])
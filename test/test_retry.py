@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+import os
+import json
+import shutil
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+
+from py2neo import GraphError
+
+import brain2neo.brain2neo as b2n
+from memory_graph import MemoryGraph
+
+
+def server_error(classification, code=None):
+    error = GraphError('{} error'.format(classification))
+    error.classification = classification
+    error.code = code
+    return error
+
+
+class FlakyGraph(MemoryGraph):
+    """ MemoryGraph failing its first failures statements transiently. """
+
+    def __init__(self, failures):
+        MemoryGraph.__init__(self)
+        self.failures = failures
+
+    def run(self, statement, parameters=None, **kwparameters):
+        if self.failures:
+            self.failures -= 1
+            raise server_error('TransientError')
+        return MemoryGraph.run(self, statement, parameters, **kwparameters)
+
+
+class RejectingGraph(MemoryGraph):
+    """
+    MemoryGraph failing statements with a row of a node named name, or
+    every statement with code if it is given.
+    """
+
+    def __init__(self, name=None, code=None):
+        MemoryGraph.__init__(self)
+        self.name = name
+        self.code = code
+        self.failures = 0
+
+    def run(self, statement, parameters=None, **kwparameters):
+        rows = dict(parameters or {}, **kwparameters).get('rows', ())
+        if self.code is not None or any(
+                isinstance(row, dict) and
+                row.get('props', {}).get('name') == self.name
+                for row in rows):
+            self.failures += 1
+            raise server_error('ClientError', self.code)
+        return MemoryGraph.run(self, statement, parameters, **kwparameters)
+
+
+class RetryTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cfg = b2n.get_cfg('example.xml')
+        self.cfg['Neo4j']['retry_delay'] = 0.001
+        self.rows = [{'i': i} for i in range(50)]
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_transient(self):
+        graph = FlakyGraph(2)
+        b2n.create_entities(graph, 'CREATE', self.rows,
+                            b2n.BatchSizer(self.cfg))
+        self.assertEqual(graph.n_rows, 50)
+
+        self.cfg['Neo4j']['max_retries'] = 1
+        with self.assertRaises(GraphError):
+            b2n.create_entities(FlakyGraph(2), 'CREATE', self.rows,
+                                b2n.BatchSizer(self.cfg))
+
+    def test_bisect(self):
+        self.cfg['Neo4j']['batch_size'] = 20
+        brain = b2n.parse_brain('example.xml', self.cfg)
+        rows = [{'i': i, 'props': {'name': name}}
+                for i, name in enumerate(brain.node_names)]
+        rejects = b2n.Rejects(os.path.join(self.work_dir, 'b.rejects'),
+                              brain)
+        graph = RejectingGraph('MGMT')
+        b2n.create_entities(graph, 'CREATE', rows,
+                            b2n.BatchSizer(self.cfg, rejects))
+        self.assertEqual(graph.n_rows, brain.node_count() - 1)
+        self.assertEqual(rejects.nodes, {brain.node_names.index('MGMT')})
+
+        with self.assertRaises(GraphError):
+            b2n.create_entities(graph, 'CREATE', rows,
+                                b2n.BatchSizer(self.cfg))
+
+    def test_circuit_breaker(self):
+        self.cfg['Neo4j']['batch_size'] = 20
+        rows = [{'props': {'name': str(i)}} for i in range(50)]
+        rejects = b2n.Rejects(os.path.join(self.work_dir, 'b.rejects'),
+                              None)
+
+        # errors of the statement are not bisected
+        graph = RejectingGraph(
+            code='Neo.ClientError.Statement.UnknownFunction')
+        with self.assertRaises(GraphError):
+            b2n.create_entities(graph, 'CREATE', rows,
+                                b2n.BatchSizer(self.cfg, rejects))
+        self.assertEqual(graph.failures, 1)
+
+        # a batch whose rows all fail alone aborts as well
+        graph = RejectingGraph('0')
+        rows = [{'props': {'name': '0'}} for _ in range(50)]
+        with self.assertRaises(GraphError):
+            b2n.create_entities(graph, 'CREATE', rows,
+                                b2n.BatchSizer(self.cfg, rejects))
+        self.assertEqual(rejects.count, 20)
+        self.assertEqual(graph.n_rows, 0)
+        rejects.close()
+
+    def test_rejects(self):
+        xml_file = os.path.join(self.work_dir, 'example.xml')
+        shutil.copy('example.xml', xml_file)
+        brain = b2n.parse_brain(xml_file, self.cfg)
+        self.assertIsNone(b2n.get_rejects(xml_file, brain, self.cfg))
+        self.cfg['Neo4j']['reject_rows'] = True
+        rejects = b2n.get_rejects(xml_file, brain, self.cfg)
+        b2n.store_entities(RejectingGraph('Steve Aoki'), brain, self.cfg,
+                           rejects=rejects)
+        rejects.close()
+
+        with open(os.path.join(self.work_dir, 'example.rejects')) as f:
+            entries = [json.loads(line) for line in f]
+        # the thought and its two links
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[0]['name'], 'Steve Aoki')
+        guid = entries[0]['node']
+        self.assertTrue(all(guid in (e['start'], e['end'])
+                            for e in entries[1:]))
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(RetryTestCase),
+    ])
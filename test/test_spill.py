@@ -0,0 +1,64 @@
+#!/usr/bin/python
+
+import os
+import pickle
+import shutil
+import tempfile
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+from brain2neo.generate import write_brain
+from brain2neo.spill import GuidIndex, SpillList
+
+
+class SpillTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.xml_file = os.path.join(self.work_dir, 'generated.xml')
+        write_brain(self.xml_file, thoughts=300, links=600, link_types=3,
+                    seed=4)
+        self.cfg = b2n.get_cfg(self.xml_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_same_brain(self):
+        brain = b2n.stream_brain(self.xml_file, self.cfg)
+        self.cfg['Parse']['spill_threshold'] = 10
+        self.cfg['Parse']['spill_cache'] = 5
+        spilled = b2n.stream_brain(self.xml_file, self.cfg)
+
+        self.assertIsNotNone(spilled.node_index.db)
+        self.assertEqual(spilled.node_guids, brain.node_guids)
+        self.assertEqual(spilled.node_labels, brain.node_labels)
+        self.assertEqual(spilled.node_extra, brain.node_extra)
+        self.assertEqual(spilled.rel_types, brain.rel_types)
+        self.assertEqual(list(spilled.rel_starts), list(brain.rel_starts))
+        self.assertEqual(list(spilled.rel_ends), list(brain.rel_ends))
+
+    def test_guid_index(self):
+        index = GuidIndex(3, 2)
+        for i, guid in enumerate('abcde'):
+            index[guid] = i
+
+        self.assertEqual(len(index), 5)
+        self.assertEqual([index[guid] for guid in 'edcba'], [4, 3, 2, 1, 0])
+        self.assertNotIn('f', index)
+        self.assertIsNone(index.get('f'))
+        self.assertEqual(pickle.loads(pickle.dumps(index)),
+                         dict(zip('abcde', range(5))))
+
+    def test_spill_list(self):
+        records = SpillList(3)
+        for i in range(7):
+            records.append(b2n.AttachmentRecord(str(i), None, None))
+
+        self.assertEqual(len(records), 7)
+        self.assertEqual([r.object_id for r in records], list('0123456'))
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(SpillTestCase),
+    ])
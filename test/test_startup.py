@@ -0,0 +1,58 @@
+#!/usr/bin/python
+
+import sys
+import subprocess
+
+from unittest import TestCase, TestLoader, TestSuite
+
+
+# modules that must only be loaded when they are used
+DEFERRED = ['py2neo', 'neo4j', 'configobj', 'validate', 'pkg_resources',
+            'concurrent.futures']
+
+
+def loaded_modules(code):
+    """ Deferred modules loaded after running code in a new interpreter. """
+    check = ('import sys\n{}\n'
+             'print(" ".join(m for m in {!r} if m in sys.modules))'
+             .format(code, DEFERRED))
+    output = subprocess.check_output([sys.executable, '-c', check])
+    return output.decode().split()
+
+
+class StartupTestCase(TestCase):
+    def test_import(self):
+        self.assertEqual(loaded_modules('import brain2neo.brain2neo'), [])
+
+    def test_help(self):
+        code = ('import io, contextlib\n'
+                'import brain2neo.brain2neo as b2n\n'
+                'sys.argv = ["brain2neo", "--help"]\n'
+                'with contextlib.redirect_stdout(io.StringIO()):\n'
+                '    try:\n'
+                '        b2n.main()\n'
+                '    except SystemExit:\n'
+                '        pass')
+        self.assertEqual(loaded_modules(code), [])
+
+    def test_offline(self):
+        # CSV export reads the configuration but never needs a driver
+        code = ('import tempfile\n'
+                'import brain2neo.brain2neo as b2n\n'
+                'from brain2neo.export import write_csv\n'
+                'cfg = b2n.get_cfg("example.xml")\n'
+                'with tempfile.TemporaryDirectory() as output_dir:\n'
+                '    brain = b2n.read_brain("example.xml", cfg)\n'
+                '    write_csv(output_dir, brain)')
+        self.assertEqual(loaded_modules(code), ['configobj', 'validate'])
+
+    def test_spec_file(self):
+        import brain2neo.brain2neo as b2n
+        with open(b2n.SPEC_FILE) as f:
+            self.assertIn('[Neo4j]', f.read())
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(StartupTestCase),
+    ])
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+from brain2neo.stats import stats, timed
+from memory_graph import MemoryGraph
+
+
+@timed
+def phase(n):
+    return sum(range(n))
+
+
+class StatsTestCase(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cfg = b2n.get_cfg('example.xml')
+        stats.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+        stats.reset()
+
+    def test_timed(self):
+        self.assertEqual(phase(10), 45)
+        phase(1000)
+        self.assertEqual(stats.phases['phase']['calls'], 2)
+        self.assertGreater(stats.phases['phase']['seconds'], 0)
+        self.assertIsNone(stats.phases['phase']['peak_bytes'])
+
+    def test_counters(self):
+        brain = b2n.stream_brain('example.xml', self.cfg)
+        b2n.store_entities(MemoryGraph(), brain, self.cfg)
+
+        counters = stats.counters
+        self.assertEqual(counters['thoughts'], 32)
+        # type thoughts become labels
+        self.assertEqual(counters['thoughts'] - counters['thoughts_ignored']
+                         - counters['types'], brain.node_count())
+        self.assertGreater(counters['links'], 0)
+        self.assertEqual(counters['rows_written'],
+                         brain.node_count() + brain.relationship_count())
+        self.assertEqual(counters['batches'],
+                         stats.phases['create_entities']['calls'])
+        self.assertGreater(stats.report()['rows_per_second'], 0)
+
+    def test_concurrent(self):
+        @timed
+        def create_entities():
+            time.sleep(0.05)
+            stats.count('rows_written', 100)
+
+        threads = [threading.Thread(target=create_entities)
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        write = stats.phases['create_entities']
+        self.assertGreaterEqual(write['seconds'], 0.2)
+        self.assertLess(write['wall_seconds'], 0.15)
+        # rows per second of wall time, not of the summed time
+        self.assertGreater(stats.report()['rows_per_second'], 400 / 0.15)
+
+    def test_report(self):
+        output = os.path.join(self.work_dir, 'stats.json')
+        argv = sys.argv
+        handlers = list(b2n.logger.handlers)
+        sys.argv = ['brain2neo', '-f', 'example.xml', '--stats', output,
+                    '--output-csv', os.path.join(self.work_dir, 'csv')]
+        try:
+            b2n.main()
+        finally:
+            sys.argv = argv
+            b2n.logger.handlers = handlers
+            b2n.logger.setLevel(logging.NOTSET)
+
+        with open(output) as f:
+            report = json.load(f)
+        self.assertIn('stream_brain', report['phases'])
+        self.assertEqual(report['phases']['stream_brain']['calls'], 1)
+        self.assertEqual(report['counters']['thoughts'], 32)
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(StatsTestCase),
+    ])
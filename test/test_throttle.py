@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+import time
+import threading
+
+from unittest import TestCase, TestLoader, TestSuite
+
+import brain2neo.brain2neo as b2n
+from memory_graph import MemoryGraph
+
+
+class SlowGraph(MemoryGraph):
+    """ MemoryGraph taking delay seconds per statement, counting overlap. """
+
+    def __init__(self, delay):
+        MemoryGraph.__init__(self)
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def run(self, statement, parameters=None, **kwparameters):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return MemoryGraph.run(self, statement, parameters, **kwparameters)
+
+
+class ThrottleTestCase(TestCase):
+    def setUp(self):
+        self.cfg = b2n.get_cfg('example.xml')
+        self.cfg['Neo4j']['batch_size'] = 10
+        self.rows = [{'i': i} for i in range(50)]
+
+    def test_unlimited(self):
+        self.assertIsNone(b2n.get_throttle(self.cfg))
+
+    def test_shared(self):
+        self.cfg['Neo4j']['max_tx_rate'] = 100
+        self.assertIs(b2n.BatchSizer(self.cfg).throttle,
+                      b2n.BatchSizer(self.cfg).throttle)
+
+    def test_rates(self):
+        self.cfg['Neo4j']['max_tx_rate'] = 50
+        sizer = b2n.BatchSizer(self.cfg)
+        start = time.monotonic()
+        b2n.create_entities(MemoryGraph(), 'CREATE', self.rows, sizer)
+        # 5 transactions, 4 intervals of 20ms
+        self.assertGreaterEqual(time.monotonic() - start, 0.075)
+
+        self.cfg['Neo4j']['max_tx_rate'] = 0
+        self.cfg['Neo4j']['max_row_rate'] = 1000
+        sizer = b2n.BatchSizer(self.cfg)
+        start = time.monotonic()
+        b2n.create_entities(MemoryGraph(), 'CREATE', self.rows, sizer)
+        self.assertGreaterEqual(time.monotonic() - start, 0.035)
+
+    def test_in_flight(self):
+        self.cfg['Neo4j']['max_in_flight'] = 1
+        sizer = b2n.BatchSizer(self.cfg)
+        graph = SlowGraph(0.01)
+        threads = [threading.Thread(target=b2n.create_entities,
+                                    args=(graph, 'CREATE', self.rows, sizer))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(graph.n_rows, 150)
+        self.assertEqual(graph.max_running, 1)
+
+    def test_backoff(self):
+        self.cfg['Neo4j']['max_latency'] = 0.005
+        throttle = b2n.Throttle(self.cfg)
+        with throttle.transaction(1):
+            time.sleep(0.01)
+        self.assertEqual(throttle.delay, throttle.MIN_DELAY)
+        with self.assertRaises(ValueError):
+            with throttle.transaction(1):
+                raise ValueError()
+        self.assertEqual(throttle.delay, 2 * throttle.MIN_DELAY)
+
+        with throttle.transaction(1):
+            pass
+        with throttle.transaction(1):
+            pass
+        self.assertEqual(throttle.delay, 0)
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(ThrottleTestCase),
+    ])
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+
+from math import ceil
+from itertools import combinations
+from unittest import TestCase, TestLoader, TestSuite
+
+from py2neo import GraphError
+
+import brain2neo.brain2neo as b2n
+from memory_graph import MemoryGraph
+
+
+def relationship_rows(graphs):
+    """ Sorted (statement, a, b) of the relationships created on graphs. """
+    return sorted((statement, row['a'], row['b'])
+                  for graph in graphs
+                  for statement, parameters in graph.statements
+                  if 'CREATE (a)' in statement
+                  for row in parameters['rows'])
+
+
+class SmallBatchGraph(MemoryGraph):
+    """ MemoryGraph failing batches of more than max_rows rows. """
+
+    def __init__(self, max_rows):
+        MemoryGraph.__init__(self)
+        self.max_rows = max_rows
+
+    def run(self, statement, parameters=None, **kwparameters):
+        rows = dict(parameters or {}, **kwparameters)['rows']
+        if len(rows) > self.max_rows:
+            raise GraphError('Out of memory')
+        return MemoryGraph.run(self, statement, parameters, **kwparameters)
+
+
+class SizerTestCase(TestCase):
+    def setUp(self):
+        self.cfg = b2n.get_cfg('example.xml')
+        neo4j_cfg = self.cfg['Neo4j']
+        neo4j_cfg['batch_size'] = 100
+        neo4j_cfg['min_batch_size'] = 10
+        neo4j_cfg['max_batch_size'] = 1000
+        neo4j_cfg['target_latency'] = 1.0
+        self.rows = [{'i': i, 'props': {'name': 'n'}} for i in range(2000)]
+
+    def test_fixed(self):
+        sizer = b2n.BatchSizer(self.cfg)
+        self.assertEqual(len(sizer.next_batch(self.rows, 0)), 100)
+        self.assertEqual(len(sizer.next_batch(self.rows, 1950)), 50)
+        sizer.committed(100, 0.01)
+        self.assertEqual(sizer.size, 100)
+        self.assertFalse(sizer.failed())
+
+    def test_bytes(self):
+        self.cfg['Neo4j']['batch_bytes'] = 10 * len(repr(self.rows[0]))
+        sizer = b2n.BatchSizer(self.cfg)
+        self.assertEqual(len(sizer.next_batch(self.rows, 0)), 10)
+        # a row larger than the limit still goes alone
+        self.cfg['Neo4j']['batch_bytes'] = 1
+        sizer = b2n.BatchSizer(self.cfg)
+        self.assertEqual(len(sizer.next_batch(self.rows, 0)), 1)
+
+    def test_adaptive(self):
+        self.cfg['Neo4j']['adaptive_batch'] = True
+        sizer = b2n.BatchSizer(self.cfg)
+        # scaled towards target latency, at most doubling or halving
+        sizer.committed(100, 0.1)
+        self.assertEqual(sizer.size, 200)
+        sizer.committed(200, 4.0)
+        self.assertEqual(sizer.size, 100)
+        sizer.committed(100, 1.25)
+        self.assertEqual(sizer.size, 80)
+        # short batches say nothing about latency
+        sizer.committed(10, 10.0)
+        self.assertEqual(sizer.size, 80)
+
+        for _ in range(10):
+            sizer.committed(sizer.size, 0.01)
+        self.assertEqual(sizer.size, 1000)
+        while sizer.failed():
+            pass
+        self.assertEqual(sizer.size, 10)
+
+    def test_shrink_on_error(self):
+        self.cfg['Neo4j']['adaptive_batch'] = True
+        graph = SmallBatchGraph(30)
+        b2n.create_entities(graph, 'CREATE', self.rows[:200],
+                            b2n.BatchSizer(self.cfg))
+        self.assertEqual(graph.n_rows, 200)
+
+        self.cfg['Neo4j']['adaptive_batch'] = False
+        with self.assertRaises(GraphError):
+            b2n.create_entities(SmallBatchGraph(30), 'CREATE', self.rows,
+                                b2n.BatchSizer(self.cfg))
+
+
+class UnwindTestCase(TestCase):
+    def setUp(self):
+        self.cfg = b2n.get_cfg('example.xml')
+        self.cfg['Neo4j']['batch_size'] = 5
+        self.brain = b2n.stream_brain('example.xml', self.cfg)
+
+    def test_statements(self):
+        statement = b2n.create_nodes_statement(frozenset(['A b', 'X`y']))
+        self.assertTrue(statement.startswith('UNWIND $rows AS row CREATE '
+                                             '(n:`A b`:`X``y`)'))
+        self.assertIn('[r:`IS A`]',
+                      b2n.create_relationships_statement('IS A'))
+
+    def test_store(self):
+        graph = MemoryGraph()
+        with self.assertLogs('brain2neo', 'INFO') as logs:
+            b2n.store_entities(graph, self.brain, self.cfg)
+        self.assertIn('rows/sec', ' '.join(logs.output))
+
+        groups = b2n.node_rows(self.brain, range(self.brain.node_count()))
+        nodes = [parameters['rows'] for statement, parameters
+                 in graph.statements if 'CREATE (n' in statement]
+        # one statement per batch of a label set
+        self.assertEqual(len(nodes),
+                         sum(ceil(len(rows) / 5) for rows in groups.values()))
+        for rows in nodes:
+            self.assertLessEqual(len(rows), 5)
+            self.assertEqual(len(set(self.brain.node_labels[row['i']]
+                                     for row in rows)), 1)
+
+        # endpoints are matched by the ids the nodes got back
+        node_ids = {}
+        ids = iter(range(graph.next_id))
+        for rows in nodes:
+            node_ids.update((row['i'], next(ids)) for row in rows)
+        for statement, parameters in graph.statements:
+            for row in parameters['rows']:
+                if 'j' in row:
+                    j = row['j']
+                    self.assertEqual(
+                        (row['a'], row['b']),
+                        (node_ids[self.brain.rel_starts[j]],
+                         node_ids[self.brain.rel_ends[j]]))
+
+
+class WorkersTestCase(TestCase):
+    def setUp(self):
+        self.cfg = b2n.get_cfg('example.xml')
+        self.cfg['Neo4j']['batch_size'] = 3
+        self.brain = b2n.stream_brain('example.xml', self.cfg)
+
+    def test_round_robin(self):
+        for n in (2, 4, 6, 8):
+            rounds = b2n.round_robin(n)
+            self.assertEqual(len(rounds), n - 1)
+            for pairs in rounds:
+                buckets = [b for pair in pairs for b in pair]
+                self.assertEqual(sorted(buckets), list(range(n)))
+            self.assertEqual(sorted(pair for pairs in rounds
+                                    for pair in pairs),
+                             list(combinations(range(n), 2)))
+
+    def test_partition(self):
+        node_ids = list(range(self.brain.node_count()))
+        groups = b2n.relationship_rows(
+            self.brain, range(self.brain.relationship_count()), node_ids)
+        rounds = b2n.partition_relationships(groups, 4)
+
+        written = []
+        for cells in rounds:
+            nodes = [set(n % 4 for cell_rows in cell.values()
+                         for row in cell_rows for n in (row['a'], row['b']))
+                     for cell in cells]
+            # cells of a round touch disjoint buckets
+            for a, b in combinations(nodes, 2):
+                self.assertFalse(a & b)
+            written.extend(row['j'] for cell in cells
+                           for cell_rows in cell.values()
+                           for row in cell_rows)
+        self.assertEqual(sorted(written),
+                         list(range(self.brain.relationship_count())))
+
+    def test_workers(self):
+        sizer = b2n.BatchSizer(self.cfg)
+        indices = range(self.brain.relationship_count())
+        serial = MemoryGraph()
+        node_ids = [None] * self.brain.node_count()
+        b2n.create_nodes(serial, self.brain, range(self.brain.node_count()),
+                         node_ids, sizer)
+        b2n.create_relationships(serial, self.brain, indices, node_ids,
+                                 sizer)
+
+        graphs = [MemoryGraph() for _ in range(3)]
+        b2n.create_relationships(graphs[0], self.brain, indices, node_ids,
+                                 sizer, b2n.GraphPool(graphs))
+
+        self.assertGreater(len(graphs[1].statements), 0)
+        self.assertEqual(relationship_rows(graphs),
+                         relationship_rows([serial]))
+
+
+def test_suite():
+    return TestSuite([
+        TestLoader().loadTestsFromTestCase(SizerTestCase),
+        TestLoader().loadTestsFromTestCase(UnwindTestCase),
+        TestLoader().loadTestsFromTestCase(WorkersTestCase),
+    ])